@@ -0,0 +1,170 @@
+import re
+from collections import namedtuple
+
+# --- Labels ---
+YES, NO, UNKNOWN = "yes", "no", "unknown"
+UNCLEAR = "unclear"   # No yes/no cue, only a negation of some other word: polarity for the question is unclear
+
+# --- Vocabulary ---
+# Whole tokens only, so "y"/"n" no longer match inside ordinary words.
+YES_TOKENS = frozenset(["yes", "yep", "yeah", "yup", "ya", "correct", "affirmative", "indeed", "sure", "y",
+                        "definitely", "absolutely", "true"])
+NO_TOKENS = frozenset(["no", "nope", "not", "negative", "don't", "dont", "can't", "cant", "n", "never", "none",
+                       "nah", "isn't", "isnt", "doesn't", "doesnt", "didn't", "didnt", "wasn't", "wasnt",
+                       "won't", "wont", "hasn't", "hasnt", "haven't", "havent", "aren't", "arent",
+                       "without", "neither", "nor"])
+UNKNOWN_TOKENS = frozenset(["unsure", "maybe", "perhaps", "possibly", "dunno", "unclear", "idk"])
+# Two-token phrases that mean "don't know" even though they contain a no-token
+UNKNOWN_BIGRAMS = frozenset([("not", "sure"), ("don't", "know"), ("dont", "know"), ("no", "idea"),
+                             ("not", "certain"), ("can't", "tell"), ("cant", "tell")])
+CLAUSE_BREAK_TOKENS = frozenset(["but", "though", "although", "however", "except"])
+SCOPE_BREAK_TOKENS = frozenset(["and", "or"])   # End a negation's scope without ending the clause
+# Words a negation reaches across to what it negates: "I do not think she has jaundice", "not at all drowsy".
+# Any other word ends its scope, so "not sleeping well and has jaundice" leaves jaundice present.
+NEGATION_TRANSPARENT_TOKENS = frozenset([
+    "i", "i'm", "he", "she", "it", "they", "we", "you", "him", "her", "his", "its", "them", "my", "our", "their",
+    "he's", "she's", "it's", "they're", "baby", "a", "an", "the", "any", "some", "that", "this", "so", "of", "to",
+    "like", "at", "all", "really", "very", "too", "quite", "ever", "even", "still", "yet", "anything",
+    "is", "are", "was", "were", "be", "been", "being", "am", "has", "have", "had", "having", "do", "does", "did",
+    "seem", "seems", "seemed", "look", "looks", "looked", "looking", "appear", "appears", "feel", "feels", "feeling",
+    "think", "believe", "see", "seen", "saw", "notice", "noticed", "show", "shows", "showed", "sign", "signs",
+    "get", "gets", "got"])
+# No-tokens that attach to a verb. When one negates some other word ("she's not sleeping well") it does
+# not answer the question; "no" and "nope" on their own always do.
+VERBAL_NO_TOKENS = NO_TOKENS - frozenset(["no", "nope", "nah", "n", "negative", "none"])
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?|[.,;!?]")
+_PUNCTUATION = frozenset(".,;!?")
+
+Classification = namedtuple("Classification", ["label", "confidence"])
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower().replace("’", "'"))
+
+
+def _negates_other_word(tokens, i):
+    # True when the verbal no-token at ``i`` reaches a content word before its scope ends.
+    if i + 1 < len(tokens) and (tokens[i], tokens[i + 1]) in UNKNOWN_BIGRAMS:
+        return False
+    for token in tokens[i + 1:]:
+        if (token in _PUNCTUATION or token in CLAUSE_BREAK_TOKENS or token in SCOPE_BREAK_TOKENS
+                or token in YES_TOKENS or token in NO_TOKENS or token in UNKNOWN_TOKENS):
+            return False
+        if token not in NEGATION_TRANSPARENT_TOKENS:
+            return True
+    return False
+
+
+def classify_tokens(tokens):
+    """One pass over tokens, returning a Classification.
+
+    A verbal no-token that negates some other word ("not sleeping well") is not counted as a no;
+    a reply with only such negations is UNCLEAR.
+    """
+    yes_hits = no_hits = unknown_hits = other_negations = 0
+    first_cue = None
+    previous = None
+    for i, token in enumerate(tokens):
+        if (previous, token) in UNKNOWN_BIGRAMS:
+            unknown_hits += 1
+            if previous in NO_TOKENS:
+                no_hits -= 1   # The "not"/"don't" was part of the phrase
+        elif token in YES_TOKENS:
+            yes_hits += 1
+            first_cue = first_cue or YES
+        elif token in VERBAL_NO_TOKENS and _negates_other_word(tokens, i):
+            other_negations += 1
+        elif token in NO_TOKENS:
+            no_hits += 1
+            first_cue = first_cue or NO
+        elif token in UNKNOWN_TOKENS:
+            unknown_hits += 1
+        previous = token
+
+    if unknown_hits and unknown_hits >= yes_hits + no_hits:
+        return Classification(UNKNOWN, min(1.0, 0.6 + 0.2 * unknown_hits))
+    if other_negations and not (yes_hits or no_hits or unknown_hits):
+        return Classification(UNCLEAR, 0.0)
+    if yes_hits == no_hits:
+        return Classification(UNKNOWN, 0.0 if not yes_hits else 0.3)
+    label = YES if yes_hits > no_hits else NO
+    margin = abs(yes_hits - no_hits) / (yes_hits + no_hits + unknown_hits)
+    confidence = margin * (0.95 if first_cue == label else 0.75)
+    return Classification(label, round(confidence, 3))
+
+
+def classify(text):
+    return classify_tokens(tokenize(text))
+
+
+# --- Multi-Symptom Extraction ---
+class SymptomMatcher:
+    """Finds protocol symptoms mentioned in free text, with their polarity, in one pass.
+
+    Phrases are each question's symptom label plus its ``synonyms``; a mention is negated when a
+    no-token reaches it across NEGATION_TRANSPARENT_TOKENS only ("I do not think she has jaundice").
+    """
+    def __init__(self, protocol):
+        self._phrases = {}   # first token -> [(phrase tokens, question id)], longest first
+        for q_data in protocol.questions:
+            symptom = q_data["symptom_node"]
+            for phrase in (symptom["label"], *symptom.get("synonyms", ())):
+                phrase_tokens = tuple(t for t in tokenize(phrase) if t not in _PUNCTUATION)
+                if phrase_tokens:
+                    self._phrases.setdefault(phrase_tokens[0], []).append((phrase_tokens, q_data["id"]))
+        for candidates in self._phrases.values():
+            candidates.sort(key=lambda item: -len(item[0]))
+
+    def extract_tokens(self, tokens, consumed=None):
+        """``{question id: YES or NO}`` for every symptom mentioned; the last mention wins.
+
+        If ``consumed`` is a set, the indices of mention tokens and their negating no-tokens are
+        added to it, so the rest of the message can be classified on its own.
+        """
+        found = {}
+        clause_start = 0
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in _PUNCTUATION or token in CLAUSE_BREAK_TOKENS:
+                clause_start = i + 1
+                i += 1
+                continue
+            for phrase_tokens, question_id in self._phrases.get(token, ()):
+                if tuple(tokens[i:i + len(phrase_tokens)]) == phrase_tokens:
+                    negators = _negator_of(tokens, clause_start, i)
+                    found[question_id] = NO if negators else YES
+                    if consumed is not None:
+                        consumed.update(negators)
+                        consumed.update(range(i, i + len(phrase_tokens)))
+                    i += len(phrase_tokens) - 1
+                    break
+            i += 1
+        return found
+
+    def extract(self, text):
+        return self.extract_tokens(tokenize(text))
+
+
+def _negator_of(tokens, clause_start, i):
+    # [index] of the no-token governing the mention at ``i``, or [] if it is not negated.
+    j = i - 1
+    while j >= clause_start:
+        if tokens[j] in NO_TOKENS:
+            return [j]
+        if tokens[j] not in NEGATION_TRANSPARENT_TOKENS:
+            return []
+        j -= 1
+    return []
+
+
+_MATCHERS = {}
+
+
+def matcher_for(protocol):
+    # Compiled once per protocol object; protocols are process-wide singletons.
+    matcher = _MATCHERS.get(id(protocol))
+    if matcher is None:
+        matcher = _MATCHERS[id(protocol)] = SymptomMatcher(protocol)
+    return matcher
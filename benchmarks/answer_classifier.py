@@ -0,0 +1,132 @@
+"""Answer classification throughput: legacy substring tests vs the token classifier and symptom extraction.
+
+    python benchmarks/answer_classifier.py [--answers 200000]
+
+Also replays ANSWER_CASES through the engine and exits 1 if any is recorded wrongly.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import answer_classifier
+import triage_engine
+import triage_protocol
+
+SHORT_ANSWERS = ["yes", "no", "Yes.", "No!", "yep", "nope", "yeah", "y", "n", "sure", "not really", "no idea",
+                 "I don't know", "maybe", "not sure", "definitely yes", "absolutely not", "correct", "negative"]
+FREE_TEXT = ["yes, she cried weakly at first", "he seems fine today", "no, but he is grunting",
+             "she was born premature and looks a bit yellow", "no chest indrawing, but he feels cold",
+             "they said his weight was normal", "yes and feeding has been really hard", "hard to say honestly",
+             "my baby is very sleepy and hard to wake", "no jaundice, no grunting", "early morning he was crying a lot"]
+# (question being asked, reply, recorded as present?); None means the question is asked again
+ANSWER_CASES = [
+    ("Q8_PaleJaundicedSkin", "No, I do not think she has jaundice", False),
+    ("Q5_DrowsyUnconscious", "I don't think he is drowsy", False),
+    ("Q5_DrowsyUnconscious", "she is not at all drowsy", False),
+    ("Q8_PaleJaundicedSkin", "no jaundice", False),
+    ("Q8_PaleJaundicedSkin", "yes, she has jaundice", True),
+    ("Q8_PaleJaundicedSkin", "she looks jaundiced", True),
+    ("Q8_PaleJaundicedSkin", "No, she has jaundice", None),
+    ("Q10_Grunting", "yes, but no grunting", None),
+    ("Q7_FeedingDifficulty", "he is not feeding", True),
+    ("Q5_DrowsyUnconscious", "she's not sleeping well and has jaundice", None),
+    ("Q10_Grunting", "he doesn't cry much and has grunting", True),
+    ("Q6_WeakCryDay1", "he doesn't cry much and has grunting", None),
+]
+# (question being asked, reply, other question it mentions, recorded as present?)
+MENTION_CASES = [
+    ("Q5_DrowsyUnconscious", "she's not sleeping well and has jaundice", "Q8_PaleJaundicedSkin", True),
+    ("Q6_WeakCryDay1", "he doesn't cry much and has grunting", "Q10_Grunting", True),
+    ("Q8_PaleJaundicedSkin", "I don't think he is drowsy or pale", "Q5_DrowsyUnconscious", False),
+]
+
+# The classifier this replaces, kept here only as the benchmark baseline.
+LEGACY_YES = ["yes", "yep", "yeah", "correct", "affirmative", "indeed", "sure", "y"]
+LEGACY_NO = ["no", "nope", "not", "negative", "don't", "can't", "n"]
+
+
+def legacy_classify(text):
+    norm = text.strip().lower()
+    is_yes = any(indicator in norm for indicator in LEGACY_YES)
+    is_no = any(indicator in norm for indicator in LEGACY_NO)
+    if is_yes and is_no:
+        return "ambiguous"
+    return "yes" if is_yes else "no" if is_no else "unknown"
+
+
+def build_corpus(n, seed):
+    rng = random.Random(seed)
+    pool = SHORT_ANSWERS * 2 + FREE_TEXT
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def timed(fn, corpus):
+    start = time.perf_counter()
+    results = [fn(text) for text in corpus]
+    return time.perf_counter() - start, results
+
+
+def _answered(protocol, question_id, text):
+    state = triage_engine.ConsultationState()
+    triage_engine.start_consultation(protocol, state)
+    state.current_question_id = question_id
+    triage_engine.submit_answer(protocol, state, text)
+    return state
+
+
+def check_answer_cases(protocol):
+    """Lines describing ANSWER_CASES and MENTION_CASES the engine records wrongly (empty when all pass)."""
+    failures = []
+    for question_id, text, expected in ANSWER_CASES:
+        state = _answered(protocol, question_id, text)
+        recorded = state.answers.get(question_id)
+        if recorded != expected or (expected is None and state.current_question_id != question_id):
+            failures.append(f"{question_id} {text!r}: recorded {recorded}, expected {expected}")
+    for question_id, text, mentioned_id, expected in MENTION_CASES:
+        state = _answered(protocol, question_id, text)
+        recorded = state.answers.get(mentioned_id, state.pending_answers.get(mentioned_id))
+        if recorded != expected:
+            failures.append(f"{question_id} {text!r}: {mentioned_id} recorded {recorded}, expected {expected}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--answers", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.answers, args.seed)
+    protocol = triage_protocol.get_protocol()
+    matcher = answer_classifier.matcher_for(protocol)
+
+    legacy_s, legacy = timed(legacy_classify, corpus)
+    token_s, tokens = timed(lambda t: answer_classifier.classify(t).label, corpus)
+    extract_s, mentions = timed(matcher.extract, corpus)
+
+    def report(name, seconds):
+        print(f"{name:<28} {args.answers / seconds:12,.0f} answers/s  ({seconds * 1e6 / args.answers:.2f} us each)")
+
+    print(f"corpus: {args.answers} answers ({len(set(corpus))} distinct)")
+    report("legacy substring", legacy_s)
+    report("token classifier", token_s)
+    report("symptom extraction", extract_s)
+    print(f"legacy labels:     {dict(Counter(legacy))}")
+    print(f"token labels:      {dict(Counter(tokens))}")
+    print(f"answers naming 2+ symptoms: {sum(len(m) >= 2 for m in mentions)}")
+
+    failures = check_answer_cases(protocol)
+    for line in failures:
+        print("WRONG", line)
+    cases = len(ANSWER_CASES) + len(MENTION_CASES)
+    print(f"answer cases: {cases - len(failures)}/{cases} recorded correctly")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
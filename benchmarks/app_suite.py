@@ -0,0 +1,234 @@
+"""Headless end-to-end suite: full consultations and pan/zoom through sample.py with Streamlit's AppTest.
+
+    python benchmarks/app_suite.py                     # run and compare with benchmarks/baselines/app_suite.json
+    python benchmarks/app_suite.py --update-baselines  # run and store the results as the new baselines
+    python benchmarks/app_suite.py --scenario mixed --variant no-graphviz --repeats 9
+
+Each scenario starts from cold process caches and is run --repeats times. Reported per scenario and
+layout variant, as the median over those runs: page load, median and p95 wall time per rerun, time
+spent in layout and render phases (from perf_spans), and peak traced memory (from one extra, traced
+pass). The "graphviz" variant runs only when the sfdp binary is installed; "no-graphviz" hides it so
+the spring-layout branch is always covered.
+
+Only deterministic metrics are gated: turns, reruns and layout engine must match the baseline and
+peak memory must stay within tolerance. Timings vary too much from run to run on shared machines to
+gate on, so they are reported with their ratio to the baseline for a person to judge. Exits 1 on a
+regression.
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+import consultation_log
+import pathway_layout
+import pathway_render
+import perf_spans
+import triage_engine
+
+APP_PATH = os.path.join(ROOT, "sample.py")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "app_suite.json")
+APP_TIMEOUT_SECONDS = 60
+MAX_TURNS = 30
+REPEATS = 5
+
+EXACT_METRICS = ("turns", "reruns", "engine")   # Must equal the baseline
+TOLERANCE = {"peak_kb": (0.30, 512.0)}         # metric: (relative slack, absolute slack for tiny values)
+TIMING_METRICS = ("load_ms", "rerun_p50_ms", "rerun_p95_ms", "layout_ms", "render_ms")   # Reported, not gated
+
+LAYOUT_PHASES = ("ui.layout",)
+RENDER_PHASES = ("ui.render", "ui.image")
+
+VIEW_SEQUENCE = ["zoom_in", "zoom_in", "pan_left", "pan_up", "pan_right", "pan_down", "zoom_out", "zoom_out",
+                 "zoom_in", "reset_view"]
+
+SCENARIOS = {
+    # name: (answers, buttons clicked afterwards)
+    "all_yes": (["yes"] * MAX_TURNS, []),
+    "all_no": (["no"] * MAX_TURNS, []),
+    "mixed": (["yes", "no", "not sure", "no, but he is grunting", "yes, a little", "nope", "I don't know",
+               "no chest indrawing", "yes", "no", "no", "no"] + ["no"] * MAX_TURNS, []),
+    # Four confirmations spread out, then the fifth reaches the threshold mid-consultation
+    "early_halt": (["yes", "no", "yes", "no", "yes", "no", "yes", "no", "yes"] + ["no"] * MAX_TURNS, []),
+    "view": (["yes", "no", "yes", "no"], VIEW_SEQUENCE),
+}
+
+
+def graphviz_available():
+    return pathway_layout.SFDP_PATH is not None
+
+
+@contextlib.contextmanager
+def _without_sfdp():
+    saved, pathway_layout.SFDP_PATH = pathway_layout.SFDP_PATH, None
+    try:
+        yield
+    finally:
+        pathway_layout.SFDP_PATH = saved
+
+
+def _clear_process_caches():
+    pathway_layout.LAYOUT_CACHE.clear()
+    pathway_render.RENDER_CACHE.clear()
+    triage_engine.GRAPH_CACHE.clear()
+    perf_spans.PROCESS_SPANS.clear()
+
+
+def _phase_total(snapshot, phases):
+    return sum(snapshot[name]["total_ms"] for name in phases if name in snapshot)
+
+
+def drive(answers, buttons):
+    """One cold session through sample.py; returns (wall times in ms per run, layout engine, turns).
+
+    The first run is the page load; the rest are reruns after an answer or a button click.
+    """
+    _clear_process_caches()
+    at = AppTest.from_file(APP_PATH, default_timeout=APP_TIMEOUT_SECONDS)
+    reruns = []
+
+    def timed_run(step):
+        start = time.perf_counter()
+        step()
+        reruns.append((time.perf_counter() - start) * 1000.0)
+        if at.exception:
+            raise RuntimeError(f"app raised: {at.exception}")
+
+    timed_run(at.run)
+    turns = 0
+    for text in answers:
+        if at.chat_input[0].disabled or at.session_state["record"].current_question < 0:
+            break   # Halted or complete
+        timed_run(at.chat_input[0].set_value(text).run)
+        turns += 1
+    for key in buttons:
+        timed_run(at.button(key=key).click().run)
+    engine = at.session_state["layout_engine"] if "layout_engine" in at.session_state else None
+    return reruns, engine, turns
+
+
+def _timings(reruns, spans):
+    load_ms, reruns = reruns[0], reruns[1:]
+    ordered = sorted(reruns)
+    return {
+        "load_ms": load_ms,
+        "rerun_p50_ms": statistics.median(reruns),
+        "rerun_p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "layout_ms": _phase_total(spans, LAYOUT_PHASES),
+        "render_ms": _phase_total(spans, RENDER_PHASES),
+    }
+
+
+def run_scenario(name, variant, repeats=REPEATS):
+    answers, buttons = SCENARIOS[name]
+    runs = []
+    with _without_sfdp() if variant == "no-graphviz" else contextlib.nullcontext():
+        for _ in range(repeats):
+            reruns, engine, turns = drive(answers, buttons)
+            runs.append(_timings(reruns, perf_spans.PROCESS_SPANS.snapshot()))
+        tracemalloc.start()
+        try:
+            drive(answers, buttons)   # Traced separately: tracing slows every allocation
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    result = {metric: round(statistics.median(run[metric] for run in runs), 2) for metric in runs[0]}
+    result.update(reruns=len(reruns) - 1, turns=turns, engine=engine, peak_kb=round(peak / 1024, 1))
+    return result
+
+
+def compare(results, baselines):
+    """Lines describing regressions against ``baselines`` (empty when everything is within tolerance)."""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        for metric in EXACT_METRICS:
+            if result[metric] != baseline[metric]:
+                regressions.append(f"{key}: {metric} {result[metric]} != baseline {baseline[metric]}")
+        for metric, (relative, slack) in TOLERANCE.items():
+            limit = baseline[metric] * (1 + relative) + slack
+            if result[metric] > limit:
+                regressions.append(f"{key}: {metric} {result[metric]} > {limit:.1f} (baseline {baseline[metric]})")
+    return regressions
+
+
+def timing_ratios(results, baselines):
+    """Lines giving each timing as a ratio to its baseline, for information only."""
+    lines = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is not None:
+            ratios = (f"{metric} x{result[metric] / baseline[metric]:.2f}" for metric in TIMING_METRICS if baseline.get(metric))
+            lines.append(f"{key}: " + ", ".join(ratios))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repeatable; default all")
+    parser.add_argument("--variant", action="append", choices=["graphviz", "no-graphviz"], help="repeatable; default all available")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="runs per scenario; medians are reported")
+    parser.add_argument("--baselines", default=BASELINE_PATH)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args()
+
+    variants = args.variant or (["graphviz", "no-graphviz"] if graphviz_available() else ["no-graphviz"])
+    if "graphviz" in variants and not graphviz_available():
+        parser.error("sfdp is not installed; the graphviz variant cannot run")
+    scenarios = args.scenario or list(SCENARIOS)
+
+    perf_spans.ENABLED = True
+    with tempfile.TemporaryDirectory() as tmp:
+        consultation_log.DEFAULT_LOG_PATH = os.path.join(tmp, "consultations.jsonl")   # Keep the real log clean
+        drive(["yes", "no"], ["zoom_in"])   # Warm-up: imports, process-wide resources and first-call code paths
+        results = {}
+        print(f"{'scenario':<26} {'engine':<15} {'load ms':>8} {'reruns':>6} {'p50 ms':>8} {'p95 ms':>8} {'layout ms':>10} "
+              f"{'render ms':>10} {'peak KB':>9}")
+        for variant in variants:
+            for name in scenarios:
+                key = f"{name}/{variant}"
+                r = results[key] = run_scenario(name, variant, args.repeats)
+                print(f"{key:<26} {str(r['engine']):<15} {r['load_ms']:>8.1f} {r['reruns']:>6} {r['rerun_p50_ms']:>8.1f} {r['rerun_p95_ms']:>8.1f} "
+                      f"{r['layout_ms']:>10.1f} {r['render_ms']:>10.1f} {r['peak_kb']:>9.0f}")
+
+    if args.update_baselines:
+        stored = {}
+        if os.path.exists(args.baselines):
+            with open(args.baselines, encoding="utf-8") as f:
+                stored = json.load(f)
+        stored.update(results)
+        os.makedirs(os.path.dirname(args.baselines), exist_ok=True)
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baselines written to {args.baselines}")
+        return 0
+
+    if not os.path.exists(args.baselines):
+        print("no baselines stored; run with --update-baselines")
+        return 0
+    with open(args.baselines, encoding="utf-8") as f:
+        baselines = json.load(f)
+    for line in timing_ratios(results, baselines):
+        print("timing vs baseline (not gated):", line)
+    regressions = compare(results, baselines)
+    for line in regressions:
+        print("REGRESSION", line)
+    print("within baselines" if not regressions else f"{len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Cold start of a new worker: time until the first question is shown, and until the first pathway.
+
+    python benchmarks/cold_start.py [--runs 5] [--think-ms 2000]
+    python benchmarks/cold_start.py --baseline-ref HEAD~1   # also measure an earlier commit, for comparison
+
+Each run starts a fresh `streamlit run sample.py` process and connects one browser session over the
+websocket protocol. Reported as
+medians: server ready (health check answers), first page (the first script run, which imports the
+app's modules and shows the first question), first pathway (the rerun after the first answer, sent
+after --think-ms; the layout and rendering modules load in that gap), and server RSS after each.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from load_test import ROOT, Session, connect, free_port, server_rss_mb, start_server
+
+
+async def first_page_and_pathway(url, pid, think_ms):
+    async with connect(f"{url}/_stcore/stream", max_size=None) as ws:
+        session = Session(ws)
+        start = time.perf_counter()
+        await session.rerun()
+        first_page = time.perf_counter() - start
+        rss_page = server_rss_mb(pid)
+        await asyncio.sleep(think_ms / 1000.0)
+        start = time.perf_counter()
+        await session.answer("yes")
+        return {"first_page_ms": first_page * 1000.0, "rss_page_mb": rss_page,
+                "first_pathway_ms": (time.perf_counter() - start) * 1000.0, "rss_pathway_mb": server_rss_mb(pid)}
+
+
+def measure(tree, log_path, think_ms):
+    port = free_port()
+    start = time.perf_counter()
+    server = start_server(port, log_path, app_path=os.path.join(tree, "sample.py"))
+    try:
+        ready_ms = (time.perf_counter() - start) * 1000.0
+        return dict(ready_ms=ready_ms, **asyncio.run(first_page_and_pathway(f"ws://127.0.0.1:{port}", server.pid, think_ms)))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def report(label, tree, runs, log_path, think_ms):
+    results = [measure(tree, log_path, think_ms) for _ in range(runs)]
+    medians = {key: statistics.median(r[key] for r in results) for key in results[0]}
+    print(f"{label:<16} {medians['ready_ms']:>9.0f} {medians['first_page_ms']:>13.0f} {medians['first_pathway_ms']:>16.0f} "
+          f"{medians['rss_page_mb']:>14.0f} {medians['rss_pathway_mb']:>15.0f}")
+    return medians
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=2000.0, help="pause between the first page and the first answer")
+    parser.add_argument("--baseline-ref", help="git ref of an earlier tree to measure the same way")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "consultations.jsonl")
+        print(f"{'tree':<16} {'ready ms':>9} {'first page ms':>13} {'first pathway ms':>16} {'rss page MB':>14} "
+              f"{'rss pathway MB':>15}")
+        if args.baseline_ref:
+            baseline_tree = os.path.join(tmp, "baseline")
+            os.makedirs(baseline_tree)
+            archive = subprocess.run(["git", "archive", args.baseline_ref], cwd=ROOT, check=True, capture_output=True).stdout
+            subprocess.run(["tar", "-x", "-C", baseline_tree], input=archive, check=True)
+            baseline = report(args.baseline_ref, baseline_tree, args.runs, log_path, args.think_ms)
+        current = report("working tree", ROOT, args.runs, log_path, args.think_ms)
+        if args.baseline_ref:
+            for key, label in (("first_page_ms", "first page"), ("first_pathway_ms", "first pathway")):
+                change = current[key] / baseline[key] - 1.0
+                print(f"{label}: {baseline[key]:.0f} ms -> {current[key]:.0f} ms ({change:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
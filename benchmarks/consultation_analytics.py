@@ -0,0 +1,130 @@
+"""Streaming analytics: batch folding of answer records, incremental log following and memory.
+
+    python benchmarks/consultation_analytics.py [--records 1000000] [--sessions 5000] [--svg out.svg]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import consultation_analytics
+import consultation_log
+import pathway_layout
+import pathway_render
+import triage_engine
+import triage_protocol
+
+ANSWER_TEXTS = {True: ["yes", "yes, a little", "yeah"], False: ["no", "not really", "nope"]}
+
+
+def write_log(path, protocol, sessions, p_yes, rng):
+    # Sessions interleaved a few at a time, as concurrent users would produce them.
+    log = consultation_log.ConsultationLog(path)
+    live = []
+    pending = [f"{i:032x}" for i in range(sessions)]
+    profiles = {}
+    while pending or live:
+        while pending and len(live) < 64:
+            sid = pending.pop()
+            live.append(sid)
+            profiles[sid] = ({q["id"]: rng.random() < p_yes for q in protocol.questions}, triage_engine.new_record(protocol))
+        sid = rng.choice(live)
+        truth, record = profiles[sid]
+        if record.current_question < 0 or record.halted:
+            live.remove(sid)
+            continue
+        question_id = protocol.questions[record.current_question]["id"]
+        text = rng.choice(ANSWER_TEXTS[truth[question_id]])
+        triage_engine.submit_to_record(protocol, record, text)
+        log.log_answer(sid, text)
+    log.close()
+    return [record for _, record in profiles.values()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--p-yes", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--svg", help="write the aggregate pathway graph here")
+    args = parser.parse_args()
+
+    protocol = triage_protocol.get_protocol()
+    n_questions = len(protocol.questions)
+
+    # Batch: answer records generated in bulk and halted by the vectorized batch scorer.
+    np_rng = np.random.default_rng(args.seed)
+    truth = np_rng.random((n_questions, args.records)) < args.p_yes
+    scores = triage_engine.score_batch(protocol, truth)
+    codes = np.where(truth.T, triage_engine.ANSWER_YES, triage_engine.ANSWER_NO).astype(np.uint8)
+    codes[np.arange(n_questions)[None, :] >= scores.questions_asked[:, None]] = triage_engine.ANSWER_UNANSWERED
+    batch = consultation_analytics.ConsultationAggregator(protocol)
+    start = time.perf_counter()
+    for chunk in range(0, args.records, 100_000):
+        batch.add_answers(codes[chunk:chunk + 100_000], scores.halted[chunk:chunk + 100_000])
+    batch_s = time.perf_counter() - start
+    print(f"records folded:   {args.records:10,d} in {batch_s * 1e3:.0f} ms ({args.records / batch_s:,.0f} records/s), "
+          f"halt rate {batch.summary()['halt_rate']:.1%}")
+
+    # Streaming: follow a log in slices, as a dashboard polling a live log would.
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "consultations.jsonl")
+        records = write_log(path, protocol, args.sessions, args.p_yes, rng)
+        with open(path, "rb") as f:
+            lines = f.readlines()
+        slice_size = max(1, len(lines) // 10)
+
+        def follow_in_slices(live_path, trace):
+            aggregator = consultation_analytics.ConsultationAggregator(protocol)
+            events, seconds, memory = 0, 0.0, []
+            for i in range(0, len(lines), slice_size):
+                with open(live_path, "ab") as f:
+                    f.writelines(lines[i:i + slice_size])
+                start = time.perf_counter()
+                events += aggregator.follow_log(live_path)
+                seconds += time.perf_counter() - start
+                if trace:
+                    memory.append(tracemalloc.get_traced_memory()[0])
+            aggregator.close_open_sessions()
+            return aggregator, events, seconds, memory
+
+        streaming, events, follow_s, _ = follow_in_slices(os.path.join(tmp, "timed.jsonl"), False)
+        tracemalloc.start()
+        _, _, _, peaks = follow_in_slices(os.path.join(tmp, "traced.jsonl"), True)   # Separate pass: tracing is slow
+        tracemalloc.stop()
+
+    from_records = consultation_analytics.ConsultationAggregator(protocol)
+    for record in records:
+        from_records.add_record(record)
+    summary = streaming.summary()
+    agree = summary == from_records.summary()
+    print(f"log events:       {events:10,d} in {follow_s * 1e3:.0f} ms ({events / follow_s:,.0f} events/s), "
+          f"{summary['consultations']} consultations, halt rate {summary['halt_rate']:.1%}")
+    print(f"traced memory after each slice (KB): {[round(p / 1024) for p in peaks]}")
+    print(f"log aggregate matches record aggregate: {agree}")
+    for a, b, count in summary["top_pairs"][:5]:
+        print(f"  {a:<24} + {b:<24} {count}")
+
+    graph = streaming.aggregate_graph()
+    pos = pathway_layout.get_layout(graph, incremental=False)
+    xs, ys = zip(*pos.values())
+    xlim, ylim = (min(xs) - 0.3, max(xs) + 0.3), (min(ys) - 0.3, max(ys) + 0.3)
+    svg = pathway_render.render_pathway(graph, pos, xlim, ylim, xlim, ylim, 1.0, 0.0, mode=pathway_render.VIEWPORT_MODE_VIEWBOX)
+    print(f"aggregate graph:  {graph.number_of_nodes()} nodes, {graph.number_of_edges()} weighted edges, "
+          f"{len(svg) // 1024} KB SVG")
+    if args.svg:
+        with open(args.svg, "w", encoding="utf-8") as f:
+            f.write(svg)
+
+
+if __name__ == "__main__":
+    main()
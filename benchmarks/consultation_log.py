@@ -0,0 +1,84 @@
+"""Consultation log: append throughput, the background index build, and per-session resume cost.
+
+Resumes are timed separately for sessions still in the bounded index (the most recently active
+MAX_INDEXED_SESSIONS) and for older ones, which are found by scanning the file. A second log on
+the same file then answers for an indexed session, as another worker process would, and the
+first must see that answer when the session comes back to it.
+
+    python benchmarks/consultation_log.py [--sessions 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import consultation_log
+import triage_engine
+import triage_protocol
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--resumes", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    protocol = triage_protocol.get_protocol()
+    rng = random.Random(args.seed)
+    session_ids = [f"{i:032x}" for i in range(args.sessions)]
+    events = [(sid, rng.choice(["yes", "no", "not really", "yes, a little"]))
+              for _ in range(len(protocol.questions)) for sid in session_ids]   # Sessions interleaved, as when live
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "consultations.jsonl")
+        log = consultation_log.ConsultationLog(path)
+        start = time.perf_counter()
+        for sid, text in events:
+            log.log_answer(sid, text)
+        log.flush()
+        append_s = time.perf_counter() - start
+        size = os.path.getsize(path)
+        log.close()
+
+        start = time.perf_counter()
+        cold = consultation_log.ConsultationLog(path)
+        cold.submissions(session_ids[-1])   # Waits for the flusher to finish indexing the file
+        index_s = time.perf_counter() - start
+
+        recent = session_ids[-cold.max_sessions:]   # Sessions are interleaved, so the last ids were active last
+        older = session_ids[:-cold.max_sessions]
+        resume_times = {"recent": [], "older": []}
+        for kind, pool in (("recent", recent), ("older", older)):
+            for sid in rng.sample(pool, min(args.resumes, len(pool))):
+                start = time.perf_counter()
+                record = triage_engine.restore_record(protocol, cold.submissions(sid))
+                resume_times[kind].append(time.perf_counter() - start)
+
+        moved = recent[-1]
+        other = consultation_log.ConsultationLog(path)
+        other.log_answer(moved, "moved")
+        other.close()
+        start = time.perf_counter()
+        seen = cold.submissions(moved)[-1:] == ("moved",)
+        catch_up_s = time.perf_counter() - start
+        cold.close()
+
+    print(f"events: {len(events)} ({args.sessions} sessions), log size {size / 1e6:.1f} MB ({size / len(events):.0f} B/event)")
+    print(f"append + flush:        {len(events) / append_s:12,.0f} events/s")
+    print(f"background index:      {index_s * 1e3:10.1f} ms (once per process, on the flusher thread)")
+    for kind, times in resume_times.items():
+        if times:
+            times.sort()
+            print(f"resume {kind + ' session:':<15} {times[len(times) // 2] * 1e3:10.2f} ms median, "
+                  f"{times[int(len(times) * 0.95)] * 1e3:.2f} ms p95")
+    print(f"resume after another process answered: {catch_up_s * 1e3:.2f} ms, its answer seen: {seen}")
+    print(f"last resumed: ends at question {record.question_index}, halted={record.halted}")
+
+
+if __name__ == "__main__":
+    main()
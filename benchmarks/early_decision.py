@@ -0,0 +1,65 @@
+"""Turns per consultation: strict protocol order vs early decisions, in protocol and decisive order.
+
+    python benchmarks/early_decision.py [--cases 2000] [--p-yes 0.2]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import triage_engine
+import triage_protocol
+
+CONFIGS = [
+    ("strict protocol order", False, triage_engine.QUESTION_ORDER_PROTOCOL),
+    ("early decision", True, triage_engine.QUESTION_ORDER_PROTOCOL),
+    ("early decision, decisive", True, triage_engine.QUESTION_ORDER_DECISIVE),
+]
+
+
+def consult(protocol, truth):
+    # One simulated user who answers each question from a fixed yes/no profile.
+    state = triage_engine.ConsultationState()
+    triage_engine.start_consultation(protocol, state)
+    turns = 0
+    while state.current_question_id and not state.consultation_halted_due_to_risk:
+        triage_engine.submit_answer(protocol, state, "yes" if truth[state.current_question_id] else "no")
+        turns += 1
+    return turns, state.consultation_halted_due_to_risk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--p-yes", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    protocol = triage_protocol.get_protocol()
+    rng = random.Random(args.seed)
+    profiles = [{q["id"]: rng.random() < args.p_yes for q in protocol.questions} for _ in range(args.cases)]
+    saved = triage_engine.EARLY_DECISION, triage_engine.QUESTION_ORDER
+
+    print(f"cases: {args.cases}, P(yes) per question: {args.p_yes}")
+    baseline_halts = None
+    try:
+        for name, early, order in CONFIGS:
+            triage_engine.EARLY_DECISION, triage_engine.QUESTION_ORDER = early, order
+            start = time.perf_counter()
+            results = [consult(protocol, truth) for truth in profiles]
+            elapsed = time.perf_counter() - start
+            halts = [halted for _, halted in results]
+            baseline_halts = baseline_halts or halts
+            mean_turns = sum(turns for turns, _ in results) / len(results)
+            agree = sum(a == b for a, b in zip(halts, baseline_halts)) / len(halts)
+            print(f"{name:<26} {mean_turns:5.2f} turns/consultation  halt rate {sum(halts) / len(halts):6.1%}  "
+                  f"same halt outcome {agree:6.1%}  {elapsed * 1e3 / len(results):.2f} ms each")
+    finally:
+        triage_engine.EARLY_DECISION, triage_engine.QUESTION_ORDER = saved
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Resident memory of the matplotlib renderer over thousands of reruns; fails if it keeps growing.
+
+    python benchmarks/figure_memory.py [--reruns 3000] [--max-growth-mb 8]
+
+Every rerun draws a random consultation state at a random zoom and pan through render_pathway with
+the render cache disabled, alternating full (SVG) and viewport (PNG) renders, so each one goes through
+a pooled FigureContext. RSS is sampled from /proc; after the first quarter (imports, font caches, the
+pool filling up) it must stay within --max-growth-mb. Also checks that pyplot holds no figures and that
+the pool and its artist count stay bounded. Exits 1 on failure.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pathway_layout
+import pathway_render
+import triage_engine
+import triage_protocol
+
+SAMPLE_EVERY = 100
+STATES = 60
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def random_states(protocol, rng, count):
+    """(graph, pos, risk) for ``count`` consultations stopped at random points."""
+    states = []
+    for _ in range(count):
+        answers = [rng.choice(["yes", "no", "no", "not sure"]) for _ in range(rng.randint(1, len(protocol.questions)))]
+        record = triage_engine.restore_record(protocol, answers)
+        graph = triage_engine.pathway_graph(protocol, record.answers)
+        if graph is not None and graph.number_of_nodes():
+            risk = record.confirmed_high_risk_indicators / protocol.max_high_risk_indicators
+            states.append((graph, pathway_layout.get_layout(graph), risk))
+    return states
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=3000)
+    parser.add_argument("--max-growth-mb", type=float, default=8.0)
+    parser.add_argument("--seed", type=int, default=17)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    protocol = triage_protocol.get_protocol()
+    states = random_states(protocol, rng, STATES)
+    no_cache = pathway_render.RenderCache(max_bytes=0)   # Nothing is stored: every rerun renders
+    samples = []
+    start = time.perf_counter()
+    for i in range(args.reruns):
+        graph, pos, risk = rng.choice(states)
+        xs, ys = zip(*pos.values())
+        full_xlim, full_ylim = (min(xs) - 0.5, max(xs) + 0.5), (min(ys) - 0.5, max(ys) + 0.5)
+        zl = rng.choice([0.5, 0.75, 1.0, 1.5, 2.0])
+        cx, cy = rng.uniform(*full_xlim), rng.uniform(*full_ylim)
+        w, h = (full_xlim[1] - full_xlim[0]) * zl, (full_ylim[1] - full_ylim[0]) * zl
+        mode = pathway_render.VIEWPORT_MODE_VIEWBOX if i % 2 else pathway_render.VIEWPORT_MODE_RASTER
+        pathway_render.render_pathway(graph, pos, (cx - w / 2, cx + w / 2), (cy - h / 2, cy + h / 2), full_xlim, full_ylim,
+                                      zl, risk, renderer_name="matplotlib", mode=mode, cache=no_cache)
+        if (i + 1) % SAMPLE_EVERY == 0:
+            samples.append((i + 1, rss_mb()))
+            print(f"{i + 1:>6} reruns  rss {samples[-1][1]:7.1f} MB  {(time.perf_counter() - start) * 1000 / (i + 1):6.1f} ms/rerun")
+
+    import matplotlib.pyplot as plt
+    settled = [mb for reruns, mb in samples if reruns > args.reruns // 4]
+    growth = settled[-1] - min(settled) if settled else 0.0
+    pool = pathway_render.FIGURE_POOL
+    artists = max((context.artist_count() for context in pool._idle), default=0)
+    print(f"rss growth after warm-up: {growth:.1f} MB (limit {args.max_growth_mb:.1f}); pyplot figures: {len(plt.get_fignums())}; "
+          f"pooled figures created: {pool.created}; artists per figure: {artists}")
+    failures = []
+    if growth > args.max_growth_mb:
+        failures.append("resident memory keeps growing")
+    if plt.get_fignums():
+        failures.append("figures left in pyplot's registry")
+    if pool.created > pool.max_idle:
+        failures.append("more figures created than the pool keeps")
+    for failure in failures:
+        print("FAIL", failure)
+    print("flat" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Concurrent-session load generator and capacity report for a local sample.py server.
+
+    python benchmarks/load_test.py [--levels 1,2,4,8,16,32] [--seconds 20] [--think-ms 800] [--slo-ms 500]
+    python benchmarks/load_test.py --url ws://127.0.0.1:8501 --pid <server pid>   # an instance already running
+
+Starts `streamlit run sample.py` headless on a free port (unless --url is given) and talks to it
+over the same websocket protocol a browser uses. Each simulated parent is one session: it walks
+the question protocol, pausing a random think time before each answer, types 'reset' when the
+consultation completes and reconnects as a new parent when it halts. Rerun latency is measured
+from sending the answer to the server's script_finished message.
+
+Reported per concurrency level: reruns/s, consultations/s, p50/p95/p99 rerun latency, server CPU
+time per rerun and share of one core, and server resident memory. The first level whose p95
+exceeds --slo-ms, or --knee-factor times the single-session p95, is flagged as where latency
+breaks down; the level before it is the capacity figure.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+from websockets.asyncio.client import connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "sample.py")
+STARTUP_TIMEOUT_SECONDS = 60
+RERUN_TIMEOUT_SECONDS = 60
+ANSWERS = {True: ["yes", "yes, I think so", "yeah"], False: ["no", "not really", "nope"]}
+COMPLETE_PLACEHOLDER = "Consultation complete"
+
+
+# --- Server ---
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, log_path, app_path=APP_PATH):
+    env = dict(os.environ, TRIAGE_LOG_PATH=log_path)   # Keep the real consultation log clean
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app_path, "--server.headless", "true", "--server.port", str(port),
+         "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(app_path), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("streamlit did not start")
+
+
+def server_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")   # utime + stime
+
+
+def server_rss_mb(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+# --- Simulated Parent ---
+class Session:
+    """One browser tab: a websocket that reruns the script and reads until script_finished."""
+    def __init__(self, ws):
+        self.ws = ws
+        self.chat_input = None   # Latest ChatInput element: id, placeholder, disabled
+
+    async def rerun(self, widgets=()):
+        message = BackMsg(rerun_script=ClientState(query_string="", widget_states=WidgetStates(widgets=list(widgets))))
+        await self.ws.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT_SECONDS))
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                if element.WhichOneof("type") == "chat_input":
+                    self.chat_input = element.chat_input
+            elif kind == "script_finished":
+                return
+
+    async def answer(self, text):
+        await self.rerun([WidgetState(id=self.chat_input.id, chat_input_value={"data": text})])
+
+
+async def parent(url, deadline, think_ms, p_yes, rng, stats):
+    while time.monotonic() < deadline:
+        async with connect(f"{url}/_stcore/stream", max_size=None) as ws:
+            session = Session(ws)
+            await session.rerun()
+            while time.monotonic() < deadline:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * think_ms / 1000.0)
+                if session.chat_input is None or session.chat_input.disabled:
+                    stats["consultations"] += 1   # Halted: this parent leaves, a new one arrives
+                    break
+                if session.chat_input.placeholder.startswith(COMPLETE_PLACEHOLDER):
+                    stats["consultations"] += 1
+                    text = "reset"
+                else:
+                    text = rng.choice(ANSWERS[rng.random() < p_yes])
+                start = time.perf_counter()
+                await session.answer(text)
+                stats["latencies"].append((time.perf_counter() - start) * 1000.0)
+
+
+async def run_level(url, concurrency, seconds, think_ms, p_yes, seed):
+    stats = {"latencies": [], "consultations": 0}
+    deadline = time.monotonic() + seconds
+    tasks = [parent(url, deadline, think_ms, p_yes, random.Random(seed * 1000 + i), stats) for i in range(concurrency)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    stats["errors"] = [r for r in results if isinstance(r, Exception)]
+    return stats
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="comma-separated concurrent session counts")
+    parser.add_argument("--seconds", type=float, default=20.0, help="duration of each level")
+    parser.add_argument("--think-ms", type=float, default=800.0, help="mean pause before each answer")
+    parser.add_argument("--p-yes", type=float, default=0.25)
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="p95 rerun latency considered acceptable")
+    parser.add_argument("--knee-factor", type=float, default=3.0, help="p95 growth over one session that counts as breakdown")
+    parser.add_argument("--url", help="ws:// base URL of a running instance instead of starting one")
+    parser.add_argument("--pid", type=int, help="process id of that instance, for CPU and memory figures")
+    parser.add_argument("--seed", type=int, default=21)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        url, pid = args.url, args.pid
+        if url is None:
+            port = free_port()
+            server = start_server(port, os.path.join(tmp, "consultations.jsonl"))
+            url, pid = f"ws://127.0.0.1:{port}", server.pid
+        try:
+            asyncio.run(run_level(url, 1, 3.0, 0.0, args.p_yes, args.seed))   # Warm-up: imports, caches, first layouts
+            print(f"server {url}, think time ~{args.think_ms:.0f} ms, {args.seconds:.0f} s per level, "
+                  f"SLO p95 <= {args.slo_ms:.0f} ms")
+            print(f"{'sessions':>8} {'reruns/s':>9} {'consult/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                  f"{'cpu ms/rerun':>12} {'cpu':>6} {'rss MB':>7}")
+            baseline_p95, breakdown, capacity = None, None, 0
+            for concurrency in levels:
+                cpu_start = server_cpu_seconds(pid) if pid else 0.0
+                wall_start = time.perf_counter()
+                stats = asyncio.run(run_level(url, concurrency, args.seconds, args.think_ms, args.p_yes, args.seed))
+                wall = time.perf_counter() - wall_start
+                cpu = (server_cpu_seconds(pid) - cpu_start) if pid else float("nan")
+                latencies = sorted(stats["latencies"])
+                p95 = percentile(latencies, 0.95)
+                baseline_p95 = baseline_p95 or p95
+                broken = bool(stats["errors"]) or p95 > args.slo_ms or p95 > args.knee_factor * baseline_p95
+                if broken and breakdown is None:
+                    breakdown = concurrency
+                elif breakdown is None:
+                    capacity = concurrency
+                print(f"{concurrency:>8} {len(latencies) / wall:>9.1f} {stats['consultations'] / wall:>9.2f} "
+                      f"{percentile(latencies, 0.50):>8.0f} {p95:>8.0f} {percentile(latencies, 0.99):>8.0f} "
+                      f"{cpu * 1000.0 / max(len(latencies), 1):>12.1f} {cpu / wall:>6.0%} "
+                      f"{server_rss_mb(pid) if pid else float('nan'):>7.0f}"
+                      f"{'  <- latency breaks down' if breakdown == concurrency else ''}")
+                for error in stats["errors"][:3]:
+                    print(f"         error: {error!r}")
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    if breakdown is None:
+        print(f"capacity: at least {capacity} concurrent sessions within the SLO (no breakdown up to {levels[-1]})")
+    else:
+        print(f"capacity: {capacity} concurrent sessions within the SLO; latency breaks down at {breakdown}")
+
+
+if __name__ == "__main__":
+    main()
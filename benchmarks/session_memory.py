@@ -0,0 +1,109 @@
+"""Per-session memory: a live DiGraph + message list + viewport floats vs the compact answer record.
+
+    python benchmarks/session_memory.py [--sessions 500]
+
+The headline counts each compact session together with its share of the pathway graphs in
+GRAPH_CACHE, at --sessions concurrent sessions. The per-rerun cost of rendering the chat from the
+transcript and fetching the graph (built on a miss) is reported too.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import triage_engine
+import triage_protocol
+
+VIEWPORT_FIELDS = ["zoom_level", "view_center_x", "view_center_y", "graph_extent_width", "graph_extent_height",
+                   "graph_content_center_x", "graph_content_center_y", "view_initialized_by_data"]
+
+
+def random_answers(rng, n):
+    return [rng.choice(["yes", "no", "yes, a little", "not really"]) for _ in range(n)]
+
+
+def _fresh(text):
+    # A new string object per session, as typed input would be, so it is counted in the measurement.
+    return text.encode().decode()
+
+
+def legacy_session(protocol, answers):
+    # What each session used to hold: its state, own graph and message dicts plus loose viewport floats.
+    state = triage_engine.ConsultationState()
+    triage_engine.start_consultation(protocol, state)
+    for text in answers:
+        triage_engine.submit_answer(protocol, state, _fresh(text))
+    graph = triage_engine.pathway_graph(protocol, triage_engine.answer_codes(protocol, state), cache=triage_engine.GraphCache())
+    messages = triage_engine.chat_messages(protocol, state.messages, state.submissions)
+    viewport = {name: float(i) + 0.5 for i, name in enumerate(VIEWPORT_FIELDS)}
+    return state, graph, messages, viewport
+
+
+def compact_session(protocol, answers):
+    record = triage_engine.new_record(protocol)
+    for text in answers:
+        triage_engine.submit_to_record(protocol, record, _fresh(text))
+    triage_engine.pathway_graph(protocol, record.answers)   # As the first rerun shows it
+    return record, triage_engine.ViewState()
+
+
+def measure(build, protocol, answer_sets, keep_shared_cache=True):
+    triage_engine.GRAPH_CACHE.clear()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = [build(protocol, answers) for answers in answer_sets]
+    if not keep_shared_cache:
+        triage_engine.GRAPH_CACHE.clear()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return total / len(sessions)
+
+
+def rerun_ms(protocol, answer_sets, cached):
+    """Median time for what a rerun derives: the chat messages and the pathway graph."""
+    records = [compact_session(protocol, answers)[0] for answers in answer_sets[:50]]
+    times = []
+    for record in records:
+        cache = triage_engine.GRAPH_CACHE if cached else triage_engine.GraphCache()
+        start = time.perf_counter()
+        triage_engine.record_messages(protocol, record)
+        triage_engine.pathway_graph(protocol, record.answers, cache=cache)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    protocol = triage_protocol.get_protocol()
+    rng = random.Random(args.seed)
+    answer_sets = [random_answers(rng, len(protocol.questions)) for _ in range(args.sessions)]
+
+    for build in (legacy_session, compact_session):   # Warm-up: matcher, regex and interning costs paid once
+        measure(build, protocol, answer_sets[:10])
+    legacy_bytes = measure(legacy_session, protocol, answer_sets)
+    shared_bytes = measure(compact_session, protocol, answer_sets)
+    cached = len(triage_engine.GRAPH_CACHE)
+    record_bytes = measure(compact_session, protocol, answer_sets, keep_shared_cache=False)
+
+    print(f"sessions:                          {args.sessions} ({cached} distinct graphs cached, "
+          f"limit {triage_engine.GRAPH_CACHE_SIZE})")
+    print(f"legacy graph + messages + floats:  {legacy_bytes:10.0f} B/session")
+    print(f"compact record + view + graphs:    {shared_bytes:10.0f} B/session")
+    print(f"compact record + view alone:       {record_bytes:10.0f} B/session")
+    print(f"saved per concurrent session:      {legacy_bytes - shared_bytes:10.0f} B ({1 - shared_bytes / legacy_bytes:.0%}, "
+          f"graphs included)")
+    print(f"rerun derivation, graph cached:    {rerun_ms(protocol, answer_sets, True):10.3f} ms")
+    print(f"rerun derivation, graph built:     {rerun_ms(protocol, answer_sets, False):10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import json
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+
+import consultation_log
+import pathway_style
+import triage_engine
+
+# --- Limits ---
+MAX_OPEN_SESSIONS = 10_000       # Sessions being followed in a log; the oldest is folded in as abandoned
+MAX_FINISHED_SESSIONS = 10_000   # Recently finished sessions, whose answers are ignored until they reset
+FOLD_BATCH = 1024                # Finished consultations buffered before being folded in with one numpy pass
+AGGREGATE_TOP_PAIRS = 6          # Co-occurrence edges drawn in the aggregate pathway graph
+
+# Mentions held for a question that was never reached count as not answered
+_SETTLED = bytes.maketrans(bytes((triage_engine.ANSWER_PENDING_YES, triage_engine.ANSWER_PENDING_NO)),
+                           bytes((triage_engine.ANSWER_UNANSWERED, triage_engine.ANSWER_UNANSWERED)))
+
+
+class ConsultationAggregator:
+    """Fixed-memory running statistics over many consultations for one protocol.
+
+    Feed it finished answer records (add_record / add_answers) or log events (add_event,
+    follow_log). Every input only adds to counters of size O(questions^2), so new data updates
+    the aggregates without recomputing from scratch. Counts are indexed in protocol order.
+    """
+    def __init__(self, protocol, max_open_sessions=MAX_OPEN_SESSIONS, max_finished_sessions=MAX_FINISHED_SESSIONS):
+        self.protocol = protocol
+        n = len(protocol.questions)
+        self.symptom_ids = [q["symptom_node"]["id"] for q in protocol.questions]
+        self._high_risk = np.fromiter((q["id"] in protocol.high_risk_question_ids for q in protocol.questions), dtype=bool, count=n)
+        self.present = np.zeros(n, dtype=np.int64)             # Consultations with the symptom present
+        self.answered = np.zeros(n, dtype=np.int64)            # Consultations that answered the question
+        self.co_occurrence = np.zeros((n, n), dtype=np.int64)  # Both symptoms present; diagonal == present
+        self.confirmed_histogram = np.zeros(protocol.max_high_risk_indicators + 1, dtype=np.int64)
+        self.consultations = self.finished = self.halted = 0
+        # Log following: answer records of sessions still in progress
+        self.max_open_sessions = max_open_sessions
+        self._open = OrderedDict()
+        self.max_finished_sessions = max_finished_sessions
+        self._finished = OrderedDict()
+        self._log_offsets = {}
+        self._rows, self._rows_halted = [], []
+
+    # --- Records ---
+    def add_answers(self, answers, halted):
+        """Fold in a batch: ``answers`` is (cases, questions) of ANSWER_* codes, ``halted`` is per case."""
+        answers = np.asarray(answers, dtype=np.uint8).reshape(-1, len(self.symptom_ids))
+        halted = np.asarray(halted, dtype=bool).reshape(-1)
+        present = answers == triage_engine.ANSWER_YES
+        resolved = present | (answers == triage_engine.ANSWER_NO)
+        as_int = present.astype(np.int64)
+        self.present += as_int.sum(axis=0)
+        self.answered += resolved.sum(axis=0)
+        self.co_occurrence += as_int.T @ as_int
+        confirmed = np.minimum(present[:, self._high_risk].sum(axis=1), len(self.confirmed_histogram) - 1)
+        self.confirmed_histogram += np.bincount(confirmed, minlength=len(self.confirmed_histogram))
+        finished = halted | (answers != triage_engine.ANSWER_UNANSWERED).all(axis=1)
+        self.consultations += len(answers)
+        self.finished += int(finished.sum())
+        self.halted += int(halted.sum())
+
+    def add_record(self, record):
+        self._add_row(bytes(record.answers).translate(_SETTLED), record.halted)
+
+    def add_state(self, state):
+        """Fold in a ConsultationState (its answers; skipped questions count as not answered)."""
+        answers = triage_engine.answer_codes(self.protocol, state)
+        self._add_row(bytes(answers).translate(_SETTLED), state.consultation_halted_due_to_risk)
+
+    def _add_row(self, answers, halted):
+        # Single consultations are batched: one numpy pass per FOLD_BATCH rows, not per row.
+        self._rows.append(answers)
+        self._rows_halted.append(halted)
+        if len(self._rows) >= FOLD_BATCH:
+            self._fold()
+
+    def _fold(self):
+        if self._rows:
+            rows, halted = self._rows, self._rows_halted
+            self._rows, self._rows_halted = [], []
+            self.add_answers(np.frombuffer(b"".join(rows), dtype=np.uint8), halted)
+
+    # --- Log Events ---
+    def add_event(self, session_id, event, text=None):
+        """Follow one logged event; a session is folded in once it halts, completes, resets or is evicted."""
+        if event == consultation_log.EVENT_RESET:
+            self._finished.pop(session_id, None)
+            self._close(session_id)
+            return
+        if event != consultation_log.EVENT_ANSWER or session_id in self._finished:
+            return   # Answers after a session finished belong to no consultation
+        record = self._open.pop(session_id, None) or triage_engine.new_record(self.protocol)
+        triage_engine.submit_to_record(self.protocol, record, text)
+        if record.halted or record.current_question < 0:
+            self.add_record(record)
+            self._finished[session_id] = True
+            while len(self._finished) > self.max_finished_sessions:
+                self._finished.popitem(last=False)
+            return
+        self._open[session_id] = record
+        while len(self._open) > self.max_open_sessions:
+            self._close(next(iter(self._open)))
+
+    def _close(self, session_id):
+        record = self._open.pop(session_id, None)
+        if record is not None:
+            self.add_record(record)
+
+    def follow_log(self, path=consultation_log.DEFAULT_LOG_PATH):
+        """Read events appended to ``path`` since the last call; returns how many were read."""
+        offset = self._log_offsets.get(path, 0)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return 0
+        count = 0
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break   # Still being written; picked up next time
+                offset += len(line)
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.add_event(event["s"], event["e"], event.get("x"))
+                count += 1
+        self._log_offsets[path] = offset
+        return count
+
+    def close_open_sessions(self):
+        """Fold in every session still in progress (as unfinished consultations)."""
+        for session_id in list(self._open):
+            self._close(session_id)
+
+    # --- Results ---
+    def prevalence(self):
+        """{symptom node id: share of consultations answering the question that reported it}."""
+        self._fold()
+        rates = self.present / np.maximum(self.answered, 1)
+        return dict(zip(self.symptom_ids, rates.tolist()))
+
+    def co_occurrence_count(self, symptom_a, symptom_b):
+        self._fold()
+        return int(self.co_occurrence[self.symptom_ids.index(symptom_a), self.symptom_ids.index(symptom_b)])
+
+    def top_pairs(self, k=10):
+        """The ``k`` most frequent co-occurring symptom pairs as (symptom a, symptom b, count)."""
+        self._fold()
+        rows, cols = np.triu_indices(len(self.symptom_ids), k=1)
+        counts = self.co_occurrence[rows, cols]
+        order = np.argsort(-counts, kind="stable")[:k]
+        return [(self.symptom_ids[rows[i]], self.symptom_ids[cols[i]], int(counts[i])) for i in order if counts[i]]
+
+    def summary(self):
+        self._fold()
+        return {
+            "consultations": self.consultations,
+            "finished": self.finished,
+            "halted": self.halted,
+            "halt_rate": self.halted / self.finished if self.finished else 0.0,
+            "in_progress": len(self._open),
+            "prevalence": self.prevalence(),
+            "top_pairs": self.top_pairs(),
+            "confirmed_histogram": self.confirmed_histogram.tolist(),
+        }
+
+    def aggregate_graph(self, top_pairs=AGGREGATE_TOP_PAIRS):
+        """A pathway graph over all consultations, drawable by pathway_render.
+
+        Symptom nodes link to their protocol nodes with ``weight`` = prevalence, and the most
+        frequent co-occurring pairs are joined by edges weighted by their share of consultations.
+        """
+        pathway_style.check_protocol(self.protocol)
+        graph = nx.DiGraph()
+        rates = self.prevalence()
+        for q_data, symptom_id, present, answered in zip(self.protocol.questions, self.symptom_ids, self.present, self.answered):
+            symptom = q_data["symptom_node"]
+            graph.add_node(symptom_id, label=symptom["label"], type="symptom_present" if present else "symptom_absent",
+                           SNOMED_ID=symptom.get("SNOMED_ID"), Source=symptom.get("Source"))
+            for linked_node_id in q_data["links_to"]:
+                if linked_node_id not in graph:
+                    graph.add_node(linked_node_id, **self.protocol.node_defs[linked_node_id])
+                graph.add_edge(symptom_id, linked_node_id, weight=rates[symptom_id],
+                               relation=f"{present}/{answered} ({rates[symptom_id]:.0%})")
+        for symptom_a, symptom_b, count in self.top_pairs(top_pairs):
+            share = count / max(self.consultations, 1)
+            graph.add_edge(symptom_a, symptom_b, weight=share, relation=f"Co-occur {count} ({share:.0%})")
+        return graph
+
+
+def aggregate_log(protocol, path=consultation_log.DEFAULT_LOG_PATH):
+    """One-shot aggregation of a whole log file, including sessions left unfinished."""
+    aggregator = ConsultationAggregator(protocol)
+    aggregator.follow_log(path)
+    aggregator.close_open_sessions()
+    return aggregator
@@ -0,0 +1,240 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Log File ---
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+DEFAULT_LOG_PATH = os.environ.get("TRIAGE_LOG_PATH") or os.path.join(LOG_DIR, "consultations.jsonl")
+
+FLUSH_EVERY_EVENTS = 64       # Write the buffer once this many events are waiting...
+FLUSH_INTERVAL_SECONDS = 0.5  # ...or at least this often, so a crash loses at most this much
+MAX_INDEXED_SESSIONS = 4096   # Recently active sessions kept in memory; older ones are found by scanning the file
+SCAN_CHUNK_BYTES = 1 << 20
+
+# --- Events ---
+# One JSON object per line: {"s": session id, "t": unix ms, "e": event, "x": answer text, "w": writer}.
+# The writer is a random id per ConsultationLog, so a process can tell other processes' lines from its own.
+EVENT_ANSWER, EVENT_RESET = "answer", "reset"
+
+
+class ConsultationLog:
+    """Append-only log of answer events, shared by every session in the process.
+
+    Events are buffered and written in batches by a background flusher. The submissions of the
+    most recently active sessions are kept in a bounded index, filled by the flusher with one pass
+    over the file and updated on append, so resuming a recent session costs a dict lookup; an older
+    one costs a scan of the file. Other processes may append to the same file: before a lookup, any
+    bytes added since the index was last brought up to date are read and their events applied.
+    """
+    def __init__(self, path=DEFAULT_LOG_PATH, flush_every=FLUSH_EVERY_EVENTS, flush_interval=FLUSH_INTERVAL_SECONDS,
+                 max_sessions=MAX_INDEXED_SESSIONS):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_sessions = max_sessions
+        self._buffer = []
+        self._index = OrderedDict()   # session id -> tuple of submissions since its last reset, least recent first
+        self._writer = os.urandom(4).hex()
+        self._own_tag = f'"w":"{self._writer}"'
+        self._synced = (None, 0)      # (inode, offset): the file's bytes the index reflects
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._indexed = threading.Event()   # Set once the flusher has read the existing file
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="consultation-log-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # --- Writing ---
+    def append(self, session_id, event, text=None):
+        record = {"s": session_id, "t": int(time.time() * 1000), "e": event}
+        if text is not None:
+            record["x"] = text
+        record["w"] = self._writer
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            if event == EVENT_RESET or session_id in self._index:   # Anything else is still complete in the file
+                _apply(self._index, session_id, event, text, self.max_sessions)
+            full = len(self._buffer) >= self.flush_every
+        if full:
+            self._wake.set()
+
+    def log_answer(self, session_id, text):
+        self.append(session_id, EVENT_ANSWER, text)
+
+    def log_reset(self, session_id):
+        self.append(session_id, EVENT_RESET)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+
+    def _flush_loop(self):
+        self._build_index()
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    # --- Replay ---
+    def submissions(self, session_id):
+        """The session's answers since its last reset, in order ((), for an unknown session)."""
+        self._indexed.wait()
+        if _file_id(self.path) != self._synced:
+            with self._flush_lock:
+                self._catch_up()
+        with self._lock:
+            if session_id in self._index:
+                self._index.move_to_end(session_id)
+                return self._index[session_id]
+        index = self._replay(lambda: read_sessions(self.path, session_id=session_id, end=self._synced[1]), session_id)
+        return index.get(session_id, ())
+
+    def _build_index(self):
+        # Runs on the flusher thread before its first flush, so no request waits on the full pass.
+        try:
+            with self._flush_lock:
+                self._synced = (_file_id(self.path)[0], 0)
+                self._catch_up()
+        finally:
+            self._indexed.set()
+
+    def _catch_up(self):
+        # Called under _flush_lock. Applies other writers' events added since the last sync; this
+        # instance's own lines were applied when appended. A truncated or replaced file is re-read whole.
+        inode, size = _file_id(self.path)
+        if inode != self._synced[0] or size < self._synced[1]:
+            with self._lock:
+                self._index.clear()
+            self._synced = (inode, 0)
+        if self._synced[1] == 0:
+            index = OrderedDict()
+            offset = _scan(self.path, lambda event: _apply(index, event["s"], event["e"], event.get("x"), self.max_sessions))
+            self._merge(index)
+        else:
+            events = []
+            offset = _scan(self.path, events.append, start=self._synced[1], skip=self._own_tag)
+            with self._lock:
+                for event in events:
+                    if event["e"] == EVENT_RESET or event["s"] in self._index:   # Anything else is complete in the file
+                        _apply(self._index, event["s"], event["e"], event.get("x"), self.max_sessions)
+        self._synced = (inode, offset)
+
+    def _replay(self, read_file, session_id=None):
+        # The file is read under _flush_lock only (the buffer cannot move to it meanwhile, appends carry
+        # on); then the buffer is replayed over it and merged into the index under _lock.
+        with self._flush_lock:
+            self._catch_up()   # So the read below stops where the index's view of the file ends
+            index = read_file()
+            if session_id is not None:
+                index.setdefault(session_id, ())   # Unknown sessions are indexed too, so they are scanned once
+            self._merge(index, session_id)
+        return index
+
+    def _merge(self, index, session_id=None):
+        # Replays the unflushed buffer over entries read from the file and adds them to the index.
+        with self._lock:
+            for line in self._buffer:
+                event = json.loads(line)
+                if session_id is None or event["s"] == session_id:
+                    _apply(index, event["s"], event["e"], event.get("x"), self.max_sessions)
+            for sid, submissions in index.items():
+                if sid not in self._index:   # An entry already indexed is at least as recent
+                    _apply(self._index, sid, None, submissions, self.max_sessions)
+
+
+def _apply(index, session_id, event, text, max_sessions=None):
+    # index is an OrderedDict kept in order of activity; event None stores ``text`` as the submissions.
+    if event == EVENT_ANSWER:
+        index[session_id] = index.pop(session_id, ()) + (text,)
+    elif event == EVENT_RESET:
+        index.pop(session_id, None)
+        index[session_id] = ()   # Known to be empty: no scan needed to resume it
+    elif event is None:
+        index[session_id] = text
+    if max_sessions is not None and len(index) > max_sessions:
+        index.popitem(last=False)
+
+
+def _file_id(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None, 0
+    return st.st_ino, st.st_size
+
+
+def _scan(path, apply, start=0, end=None, only=None, skip=None):
+    """Call apply(event) for each complete line from byte ``start`` (to ``end``); returns the offset reached.
+
+    ``only`` and ``skip`` are strings a line must, or must not, contain to be parsed. The file is read
+    in chunks and searched with str.find, which is much faster than iterating over lines.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return start
+    offset, tail = start, b""
+    with f:
+        f.seek(start)
+        while end is None or offset < end:
+            chunk = f.read(SCAN_CHUNK_BYTES)
+            if not chunk:
+                break
+            data = tail + chunk
+            cut = data.rfind(b"\n") + 1   # A torn last line is still being written; it is read next time
+            data, tail = data[:cut], data[cut:]
+            if end is not None:
+                data = data[:end - offset]   # ``end`` is always a line boundary
+            offset += len(data)
+            for line in _lines(data.decode("utf-8", errors="replace"), only):
+                if skip is not None and skip in line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                apply(event)
+    return offset
+
+
+def _lines(data, only):
+    if only is None:
+        yield from data.split("\n")
+        return
+    pos = data.find(only)
+    while pos >= 0:
+        line_start, line_end = data.rfind("\n", 0, pos) + 1, data.find("\n", pos)
+        yield data[line_start:line_end]
+        pos = data.find(only, line_end)
+
+
+def read_sessions(path=DEFAULT_LOG_PATH, max_sessions=None, session_id=None, end=None):
+    """Replay a log file in one pass into {session id: submissions}, least recently active first.
+
+    Keeps only the ``max_sessions`` most recently active sessions, or only ``session_id``, and
+    reads only the first ``end`` bytes if given. A torn last line is ignored.
+    """
+    index = OrderedDict()
+
+    def apply(event):
+        if session_id is None or event["s"] == session_id:
+            _apply(index, event["s"], event["e"], event.get("x"), max_sessions)
+    _scan(path, apply, end=end, only=session_id)
+    return index
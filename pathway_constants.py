@@ -0,0 +1,4 @@
+# --- Shared Pathway Constants ---
+HIGH_RISK_NODE_ID = "HighRiskOfDeath_R"
+HIGH_RISK_LABEL_PREFIX = "⚠️ " 
+SYMPTOM_NODE_PREFIX = "🩺 "     
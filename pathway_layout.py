@@ -0,0 +1,271 @@
+import hashlib
+import math
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import networkx as nx
+
+from perf_spans import span
+
+# --- Layout Settings ---
+SFDP_ARGS = "-Goverlap=false -Gsplines=true -Gsep=+35 -Gnodesep=0.7"
+SFDP_PATH = shutil.which("sfdp")   # Graphviz's sfdp, run as a subprocess so a slow layout can be killed
+POINTS_PER_INCH = 72               # sfdp's plain output is in inches; positions are kept in points
+SPRING_KWARGS = {"k": 1.3, "iterations": 160, "seed": 42, "dim": 2, "scale": 2.2}
+LAYOUT_CACHE_SIZE = 256
+INCREMENTAL_CANDIDATE_ANGLES = 16
+
+# --- Background Layout Settings ---
+LAYOUT_WORKERS = 2
+LAYOUT_WAIT_SECONDS = 0.2      # How long a rerun blocks on a fresh layout before showing last known positions
+LAYOUT_TIMEOUT_SECONDS = 10.0  # An sfdp run is killed after this; a request waiting longer lays out with spring itself
+
+# Which engine produced a set of positions
+ENGINE_SFDP = "sfdp"
+ENGINE_SPRING = "spring"                    # sfdp not installed
+ENGINE_SPRING_FALLBACK = "spring-fallback"  # sfdp failed or timed out
+ENGINE_INCREMENTAL = "incremental"
+ENGINE_PENDING = "pending"                  # Provisional positions while a background job runs
+
+LayoutResult = namedtuple("LayoutResult", ["pos", "engine", "ready"])
+
+
+# --- Structural Fingerprint ---
+def graph_fingerprint(graph):
+    """Hash of node ids and edges only; attribute changes keep the same fingerprint."""
+    h = hashlib.blake2b(digest_size=16)
+    for node in sorted(map(str, graph.nodes)):
+        h.update(node.encode()); h.update(b"\x00")
+    h.update(b"\x01")
+    for u, v in sorted((str(u), str(v)) for u, v in graph.edges):
+        h.update(u.encode()); h.update(b"\x02"); h.update(v.encode()); h.update(b"\x00")
+    return h.hexdigest()
+
+
+# --- Position Cache ---
+class LayoutCache:
+    """LRU of ``fingerprint -> (positions, engine)``; safe to fill from layout worker threads."""
+    def __init__(self, maxsize=LAYOUT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return dict(entry[0]), entry[1]
+
+    def put(self, fingerprint, pos, engine):
+        with self._lock:
+            self._entries[fingerprint] = (dict(pos), engine)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Lives in an imported module so it survives Streamlit reruns and is shared by all sessions.
+LAYOUT_CACHE = LayoutCache()
+
+
+# --- Layout Engines ---
+def _as_tuples(pos):
+    return {node: (float(xy[0]), float(xy[1])) for node, xy in pos.items()}
+
+
+def spring_layout(graph, engine=ENGINE_SPRING):
+    with span("layout.spring"):
+        return _as_tuples(nx.spring_layout(graph, **SPRING_KWARGS)), engine
+
+
+def _dot_id(node):
+    return '"' + str(node).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def sfdp_layout(graph, timeout=LAYOUT_TIMEOUT_SECONDS):
+    """Positions from the sfdp binary; raises subprocess.TimeoutExpired (after killing it) or on failure."""
+    lines = ["digraph {"]
+    lines += [f"{_dot_id(node)};" for node in graph.nodes]
+    lines += [f"{_dot_id(u)} -> {_dot_id(v)};" for u, v in graph.edges]
+    lines.append("}")
+    names = {str(node): node for node in graph.nodes}
+    out = subprocess.run([SFDP_PATH, *SFDP_ARGS.split(), "-Tplain"], input="\n".join(lines), capture_output=True,
+                         text=True, timeout=timeout, check=True).stdout
+    pos = {}
+    for line in out.splitlines():
+        fields = shlex.split(line)
+        if fields and fields[0] == "node":
+            pos[names[fields[1]]] = (float(fields[2]) * POINTS_PER_INCH, float(fields[3]) * POINTS_PER_INCH)
+    if len(pos) != len(names):
+        raise ValueError("sfdp output is missing nodes")
+    return pos
+
+
+def full_layout(graph, timeout=LAYOUT_TIMEOUT_SECONDS):
+    """``(positions, engine)`` from sfdp, falling back to a spring layout."""
+    if SFDP_PATH is None:
+        return spring_layout(graph, ENGINE_SPRING)
+    try:
+        with span("layout.sfdp"):
+            return sfdp_layout(graph, timeout), ENGINE_SFDP
+    except Exception:
+        return spring_layout(graph, ENGINE_SPRING_FALLBACK)
+
+
+def _typical_spacing(pos):
+    points = list(pos.values())
+    if len(points) < 2:
+        return 1.0
+    nearest = []
+    for i, (x1, y1) in enumerate(points):
+        nearest.append(min(math.hypot(x1 - x2, y1 - y2) for j, (x2, y2) in enumerate(points) if j != i))
+    nearest.sort()
+    spacing = nearest[len(nearest) // 2]
+    return spacing if spacing > 1e-6 else 1.0
+
+
+def incremental_layout(graph, pinned_pos):
+    """Keep every pinned position and place only the nodes that are new since it was computed."""
+    pos = {node: pinned_pos[node] for node in graph.nodes if node in pinned_pos}
+    new_nodes = [node for node in graph.nodes if node not in pos]
+    if not pos:
+        return None
+    spacing = _typical_spacing(pos)
+    cx = sum(x for x, _ in pos.values()) / len(pos)
+    cy = sum(y for _, y in pos.values()) / len(pos)
+    for node in new_nodes:
+        anchors = [pos[n] for n in nx.all_neighbors(graph, node) if n in pos]
+        if anchors:
+            ax_, ay_ = sum(x for x, _ in anchors) / len(anchors), sum(y for _, y in anchors) / len(anchors)
+        else:
+            ax_, ay_ = cx, cy
+        best, best_clearance = None, -1.0
+        for ring in (1.0, 1.6, 2.4):
+            for k in range(INCREMENTAL_CANDIDATE_ANGLES):
+                angle = 2 * math.pi * k / INCREMENTAL_CANDIDATE_ANGLES
+                candidate = (ax_ + spacing * ring * math.cos(angle), ay_ + spacing * ring * math.sin(angle))
+                clearance = min(math.hypot(candidate[0] - x, candidate[1] - y) for x, y in pos.values())
+                if clearance > best_clearance:
+                    best, best_clearance = candidate, clearance
+            if best_clearance >= spacing * 0.9:
+                break
+        pos[node] = best
+    return pos
+
+
+def get_layout(graph, previous_pos=None, incremental=True, cache=LAYOUT_CACHE):
+    """Positions for ``graph``: cached by fingerprint, otherwise incremental from ``previous_pos`` or a full run."""
+    if graph.number_of_nodes() == 0:
+        return {}
+    fingerprint = graph_fingerprint(graph)
+    hit = cache.get(fingerprint)
+    if hit is not None:
+        return hit[0]
+    pos = None
+    if incremental and previous_pos:
+        pos, engine = incremental_layout(graph, previous_pos), ENGINE_INCREMENTAL
+    if pos is None:
+        pos, engine = full_layout(graph)
+    cache.put(fingerprint, pos, engine)
+    return pos
+
+
+# --- Background Layout ---
+class _LayoutJob:
+    def __init__(self, future, engine):
+        self.future = future
+        self.engine = engine
+        self.submitted = time.monotonic()
+
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=LAYOUT_WORKERS, thread_name_prefix="pathway-layout")
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+
+
+def _submit(fingerprint, graph, cache):
+    """Start (or join) the background job for ``fingerprint``; its result lands in ``cache``."""
+    with _JOBS_LOCK:
+        job = _JOBS.get(fingerprint)
+        if job is not None:
+            return job
+        snapshot = graph.copy()   # The session graph keeps changing while the worker runs
+        future = _EXECUTOR.submit(full_layout, snapshot)
+        job = _JOBS[fingerprint] = _LayoutJob(future, ENGINE_SFDP)
+
+    def _done(done_future):
+        with _JOBS_LOCK:
+            if _JOBS.get(fingerprint) is not job:
+                return   # Abandoned for an inline fallback; drop the late result
+            del _JOBS[fingerprint]
+        if done_future.exception() is None:
+            cache.put(fingerprint, *done_future.result())
+
+    future.add_done_callback(_done)
+    return job
+
+
+def request_layout(graph, previous_pos=None, incremental=True, wait=LAYOUT_WAIT_SECONDS,
+                   timeout=LAYOUT_TIMEOUT_SECONDS, cache=LAYOUT_CACHE):
+    """Non-blocking counterpart of get_layout, returning a LayoutResult.
+
+    Full layouts run in the worker pool. If one is not finished within ``wait`` seconds the
+    result has ``ready=False`` and carries ``previous_pos`` (with any new nodes placed
+    provisionally), so the caller can draw the last known picture and try again next rerun.
+    A job still unfinished after ``timeout`` (queued behind others, or sfdp itself) is abandoned
+    and a spring layout computed here instead, so a busy pool cannot keep the caller waiting.
+    """
+    if graph.number_of_nodes() == 0:
+        return LayoutResult({}, ENGINE_PENDING, True)
+    fingerprint = graph_fingerprint(graph)
+    hit = cache.get(fingerprint)
+    if hit is not None:
+        return LayoutResult(hit[0], hit[1], True)
+    if incremental and previous_pos:
+        with span("layout.incremental"):
+            pos = incremental_layout(graph, previous_pos)
+        if pos is not None:
+            cache.put(fingerprint, pos, ENGINE_INCREMENTAL)
+            return LayoutResult(pos, ENGINE_INCREMENTAL, True)
+
+    job = _submit(fingerprint, graph, cache)
+    if time.monotonic() - job.submitted > timeout:
+        with _JOBS_LOCK:
+            if _JOBS.get(fingerprint) is job:
+                del _JOBS[fingerprint]
+        job.future.cancel()   # Only stops it if still queued; a running sfdp is killed by its own timeout
+        pos, engine = spring_layout(graph, ENGINE_SPRING_FALLBACK)
+        cache.put(fingerprint, pos, engine)
+        return LayoutResult(pos, engine, True)
+    try:
+        with span("layout.wait"):
+            pos, engine = job.future.result(timeout=wait)
+        cache.put(fingerprint, pos, engine)
+        return LayoutResult(pos, engine, True)
+    except FutureTimeoutError:
+        pass
+    except Exception:
+        pos, engine = spring_layout(graph, ENGINE_SPRING_FALLBACK)
+        cache.put(fingerprint, pos, engine)
+        return LayoutResult(pos, engine, True)
+    provisional = incremental_layout(graph, previous_pos) if previous_pos else None
+    return LayoutResult(provisional or {}, ENGINE_PENDING, False)
@@ -0,0 +1,473 @@
+import contextlib
+import hashlib
+import io
+import math
+import re
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+import pathway_style as style
+from perf_spans import span
+
+# --- Render Settings ---
+FIGSIZE = (17, 15)
+CANVAS_W, CANVAS_H = FIGSIZE[0] * 72.0, FIGSIZE[1] * 72.0   # SVG user units are points, like matplotlib's SVG backend
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+VIEWPORT_MODE_VIEWBOX = "viewbox"   # Render the full pathway once as SVG, pan/zoom crops its viewBox
+VIEWPORT_MODE_RASTER = "raster"     # Re-render each viewport with zoom-scaled sizes (cached per viewport)
+
+VIEWPORT_MODE_AUTO = "auto"         # viewbox for small pathways, per-viewport culled renders for large ones
+VIEWBOX_MAX_NODES = 40
+
+# --- Level of Detail ---
+LOD_FULL = "full"           # Detail blocks (SNOMED/GPHR/WHO/Source) and edge labels
+LOD_COMPACT = "compact"     # Main node labels only
+LOD_COMPACT_ZOOM = 1.5      # zoom_level above this (zoomed out) draws compact nodes
+LOD_DETAIL_MAX_NODES = 30   # More visible nodes than this draws compact nodes at any zoom
+CULL_MARGIN = 0.15          # Viewport padding, as a fraction of its size, so labels at the edge still show
+
+_VIEWBOX_RE = re.compile(r'viewBox="[^"]*"')
+
+
+# --- Render Signature ---
+def render_signature(graph, pos):
+    """Hash of everything that changes the drawing: nodes, edges, their attributes and positions."""
+    h = hashlib.blake2b(digest_size=16)
+    for node, data in sorted(graph.nodes(data=True), key=lambda item: str(item[0])):
+        x, y = pos.get(node, (0.0, 0.0))
+        h.update(repr((str(node), sorted(data.items()), round(x, 4), round(y, 4))).encode())
+    for u, v, data in sorted(graph.edges(data=True), key=lambda item: (str(item[0]), str(item[1]))):
+        h.update(repr((str(u), str(v), sorted(data.items()))).encode())
+    return h.hexdigest()
+
+
+def level_of_detail(zl, visible_node_count):
+    if zl > LOD_COMPACT_ZOOM or visible_node_count > LOD_DETAIL_MAX_NODES:
+        return LOD_COMPACT
+    return LOD_FULL
+
+
+def cull_to_viewport(graph, pos, xlim, ylim, margin=CULL_MARGIN):
+    """(nodes, edges) whose position or arc bounding box intersects the padded viewport."""
+    pad_x, pad_y = (xlim[1] - xlim[0]) * margin, (ylim[1] - ylim[0]) * margin
+    x0, x1, y0, y1 = xlim[0] - pad_x, xlim[1] + pad_x, ylim[0] - pad_y, ylim[1] + pad_y
+    nodes = {node for node in graph.nodes if node in pos and x0 <= pos[node][0] <= x1 and y0 <= pos[node][1] <= y1}
+    edges = []
+    for u, v in graph.edges:
+        if u in nodes or v in nodes:
+            edges.append((u, v)); continue
+        if u not in pos or v not in pos:
+            continue
+        (ux, uy), (vx, vy) = pos[u], pos[v]
+        bulge = 0.2 * math.hypot(vx - ux, vy - uy)   # arc3,rad=0.2 bows at most this far off the chord
+        if min(ux, vx) - bulge <= x1 and max(ux, vx) + bulge >= x0 and min(uy, vy) - bulge <= y1 and max(uy, vy) + bulge >= y0:
+            edges.append((u, v))
+    return nodes, edges
+
+
+# --- Memory-Bounded Render Cache ---
+class RenderCache:
+    """LRU of rendered images bounded by total bytes; shared by every session's script thread."""
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+RENDER_CACHE = RenderCache()
+
+
+# --- Renderer Interface ---
+class PathwayRenderer:
+    """Draws a pathway graph. Both methods take data-space limits ``xlim``/``ylim``.
+
+    ``lod`` is LOD_FULL or LOD_COMPACT; ``visible`` is an optional ``(nodes, edges)`` pair from
+    cull_to_viewport, in which case nothing outside it is drawn.
+    """
+    name = ""
+
+    def render_full(self, graph, pos, xlim, ylim, current_risk_score_normalized, lod=LOD_FULL):
+        """Whole pathway at zoom 1 as ``(svg_text, transform)`` for viewBox cropping."""
+        raise NotImplementedError
+
+    def render_viewport(self, graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod=LOD_FULL, visible=None):
+        """One viewport with zoom-scaled marker and font sizes, as image data for ``st.image``."""
+        raise NotImplementedError
+
+
+def _transform(xlim, ylim, ax_x0, ax_y0, ax_w, ax_h, fig_h):
+    return {"xlim": tuple(xlim), "ylim": tuple(ylim), "ax_x0": ax_x0, "ax_y0": ax_y0, "ax_w": ax_w, "ax_h": ax_h, "fig_h": fig_h}
+
+
+# --- Direct SVG Renderer ---
+class SvgRenderer(PathwayRenderer):
+    """Writes SVG elements directly: circles, arc arrows and rounded label boxes, no plotting library."""
+    name = "svg"
+    # Axes rectangle inside the canvas, as figure fractions (leaves room for the title)
+    AX_LEFT, AX_BOTTOM, AX_RIGHT, AX_TOP = 0.03, 0.03, 0.97, 0.92
+    ARC_RAD = 0.2
+    ARROW_LENGTH, ARROW_HALF_WIDTH = 0.4 * 32, 0.2 * 32   # "-|>" head at arrowsize=32
+    CHAR_WIDTH = 0.6      # Approximate glyph width as a fraction of the font size
+    LINE_HEIGHT = 1.2
+
+    def render_full(self, graph, pos, xlim, ylim, current_risk_score_normalized, lod=LOD_FULL):
+        return self._render(graph, pos, xlim, ylim, 1.0, current_risk_score_normalized, lod, None)
+
+    def render_viewport(self, graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod=LOD_FULL, visible=None):
+        svg_text, _ = self._render(graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod, visible)
+        return svg_text
+
+    def _render(self, graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod, visible):
+        ax_x0, ax_y0 = self.AX_LEFT * CANVAS_W, self.AX_BOTTOM * CANVAS_H
+        ax_w, ax_h = (self.AX_RIGHT - self.AX_LEFT) * CANVAS_W, (self.AX_TOP - self.AX_BOTTOM) * CANVAS_H
+        sx = ax_w / ((xlim[1] - xlim[0]) or 1.0)
+        sy = ax_h / ((ylim[1] - ylim[0]) or 1.0)
+
+        def to_svg(xy):
+            return ax_x0 + (xy[0] - xlim[0]) * sx, CANVAS_H - (ax_y0 + (xy[1] - ylim[0]) * sy)
+
+        label_fs, edge_label_fs, title_fs = style.zoom_font_sizes(zl)
+        draw_nodes, draw_edges = visible if visible is not None else (graph.nodes, graph.edges)
+        points = {node: to_svg(pos[node]) for node in graph.nodes if node in pos}
+        radii = {node: math.sqrt(style.node_size_for(data) / (zl**0.55)) / 2 for node, data in graph.nodes(data=True)}
+
+        out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{CANVAS_W:.0f}pt" height="{CANVAS_H:.0f}pt" '
+               f'viewBox="0 0 {CANVAS_W:.0f} {CANVAS_H:.0f}" font-family="DejaVu Sans, sans-serif">',
+               f'<rect width="100%" height="100%" fill="{style.BACKGROUND_COLOR}"/>']
+
+        edge_labels = []
+        for u, v in draw_edges:
+            if u not in points or v not in points:
+                continue
+            data = graph.edges[u, v]
+            color, width, line_style = style.edge_style(graph.nodes[u].get("type"), v, current_risk_score_normalized, data.get("weight"))
+            (x1, y1), (x2, y2) = points[u], points[v]
+            # matplotlib's arc3 control point, with the y axis flipped for SVG
+            mx, my = (x1 + x2) / 2, (y1 + y2) / 2
+            cx, cy = mx - self.ARC_RAD * (y2 - y1), my + self.ARC_RAD * (x2 - x1)
+            sx1, sy1 = _toward(x1, y1, cx, cy, radii[u])
+            tip_x, tip_y = _toward(x2, y2, cx, cy, radii[v])
+            ex, ey = _toward(tip_x, tip_y, cx, cy, self.ARROW_LENGTH)
+            dash = f' stroke-dasharray="{3.7 * width:.1f},{1.6 * width:.1f}"' if line_style == "dashed" else ""
+            out.append(f'<path d="M{sx1:.1f},{sy1:.1f} Q{cx:.1f},{cy:.1f} {ex:.1f},{ey:.1f}" fill="none" '
+                       f'stroke="{color}" stroke-width="{width:.2f}" stroke-opacity="0.92"{dash}/>')
+            out.append(_arrow_head(tip_x, tip_y, ex, ey, self.ARROW_HALF_WIDTH, color))
+            if lod == LOD_FULL and data.get("relation"):
+                edge_labels.append((0.25 * x1 + 0.5 * cx + 0.25 * x2, 0.25 * y1 + 0.5 * cy + 0.25 * y2, data["relation"]))
+
+        for node in draw_nodes:
+            if node not in points:
+                continue
+            x, y = points[node]
+            face, edge = style.node_colors_for(graph.nodes[node])
+            out.append(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{radii[node]:.1f}" fill="{face}" fill-opacity="0.96" '
+                       f'stroke="{edge}" stroke-width="2.5"/>')
+
+        for node in draw_nodes:
+            if node not in points:
+                continue
+            x, y = points[node]
+            if lod == LOD_FULL:
+                lines = style.node_label(node, graph.nodes[node]).split("\n")
+            else:
+                lines = [style.node_label_parts(node, graph.nodes[node])[0]]
+            out.append(self._text_box(x, y, lines, label_fs, 0.8, "#F5FFFA", 0.93, "#2F4F4F", "#000000"))
+
+        for x, y, text in edge_labels:
+            out.append(self._text_box(x, y, [text], edge_label_fs, 0.4, "#FFFFFF", 0.82, None, style.EDGE_LABEL_COLOR))
+
+        title_y = CANVAS_H - ax_y0 - ax_h - title_fs
+        out.append(f'<text x="{CANVAS_W / 2:.1f}" y="{title_y:.1f}" font-size="{title_fs:.1f}" font-weight="bold" '
+                   f'fill="{style.TITLE_COLOR}" text-anchor="middle">{escape(style.TITLE_TEXT)}</text>')
+        out.append("</svg>")
+        return "\n".join(out), _transform(xlim, ylim, ax_x0, ax_y0, ax_w, ax_h, CANVAS_H)
+
+    def _text_box(self, x, y, lines, fs, pad, face, alpha, edge, text_color):
+        line_h = fs * self.LINE_HEIGHT
+        pad_pt = pad * fs
+        w = max(len(line) for line in lines) * fs * self.CHAR_WIDTH + 2 * pad_pt
+        h = len(lines) * line_h + 2 * pad_pt
+        stroke = f' stroke="{edge}" stroke-width="1"' if edge else ""
+        parts = [f'<g><rect x="{x - w / 2:.1f}" y="{y - h / 2:.1f}" width="{w:.1f}" height="{h:.1f}" rx="{pad_pt:.1f}" '
+                 f'fill="{face}" fill-opacity="{alpha}"{stroke}/>',
+                 f'<text font-size="{fs:.1f}" fill="{text_color}" text-anchor="middle">']
+        first_baseline = y - h / 2 + pad_pt + fs
+        for i, line in enumerate(lines):
+            parts.append(f'<tspan x="{x:.1f}" y="{first_baseline + i * line_h:.1f}">{escape(line)}</tspan>')
+        parts.append("</text></g>")
+        return "".join(parts)
+
+
+def _toward(x, y, tx, ty, distance):
+    dx, dy = tx - x, ty - y
+    length = math.hypot(dx, dy)
+    if length < 1e-9:
+        return x, y
+    return x + dx / length * distance, y + dy / length * distance
+
+
+def _arrow_head(tip_x, tip_y, base_x, base_y, half_width, color):
+    dx, dy = tip_x - base_x, tip_y - base_y
+    length = math.hypot(dx, dy) or 1.0
+    nx_, ny_ = -dy / length * half_width, dx / length * half_width
+    return (f'<polygon points="{tip_x:.1f},{tip_y:.1f} {base_x + nx_:.1f},{base_y + ny_:.1f} '
+            f'{base_x - nx_:.1f},{base_y - ny_:.1f}" fill="{color}" fill-opacity="0.92"/>')
+
+
+# --- Matplotlib Renderer ---
+FIGURE_POOL_SIZE = 4   # Idle figures kept for reuse; renders beyond this many at once get a figure that is dropped after
+EDGE_LABEL_ZORDER = 1.5
+
+
+class _ArtistPool:
+    """Artists keyed by node or edge. Keys not drawn this time are hidden and their artists handed to new keys."""
+    def __init__(self, make):
+        self.make = make
+        self.live = {}
+        self.spare = []
+
+    def update(self, keys):
+        """[(key, artist)] for ``keys``, visible; every other artist hidden."""
+        keys = list(keys)
+        wanted = set(keys)
+        for key in [key for key in self.live if key not in wanted]:
+            artist = self.live.pop(key)
+            artist.set_visible(False)
+            self.spare.append(artist)
+        for key in keys:
+            if key not in self.live:
+                self.live[key] = self.spare.pop() if self.spare else self.make()
+            self.live[key].set_visible(True)
+        return [(key, self.live[key]) for key in keys]
+
+    def __len__(self):
+        return len(self.live) + len(self.spare)
+
+
+class FigureContext:
+    """One reusable pathway figure: the node collection, edge arrows and labels are updated in place per draw.
+
+    The figure is created without pyplot, so it never enters pyplot's global figure registry.
+    """
+    def __init__(self):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=FIGSIZE, facecolor=style.BACKGROUND_COLOR)
+        FigureCanvasAgg(self.fig)
+        r = SvgRenderer   # Same axes rectangle as the SVG renderer, instead of a tight_layout pass per draw
+        self.ax = self.fig.add_axes((r.AX_LEFT, r.AX_BOTTOM, r.AX_RIGHT - r.AX_LEFT, r.AX_TOP - r.AX_BOTTOM))
+        self.ax.set_facecolor(style.BACKGROUND_COLOR)
+        self.ax.axis("off")
+        self.title = self.ax.set_title(style.TITLE_TEXT, fontweight="bold", color=style.TITLE_COLOR)
+        self.nodes = self.ax.scatter([], [], marker="o", alpha=0.96, linewidths=2.5, zorder=2)
+        self.edges = _ArtistPool(self._new_edge)
+        self.labels = _ArtistPool(self._new_label)
+        self.edge_labels = _ArtistPool(self._new_edge_label)
+
+    def _new_edge(self):
+        from matplotlib.patches import FancyArrowPatch
+        patch = FancyArrowPatch((0, 0), (0, 0), arrowstyle="-|>", mutation_scale=32, alpha=0.92, zorder=1,
+                                connectionstyle=f"arc3,rad={SvgRenderer.ARC_RAD}")
+        self.ax.add_patch(patch)
+        return patch
+
+    def _new_label(self):
+        return self.ax.text(0, 0, "", ha="center", va="center", family="sans-serif", clip_on=True,
+                            bbox=dict(facecolor="mintcream", alpha=0.93, edgecolor="darkslategray", boxstyle="round,pad=0.8"))
+
+    def _new_edge_label(self):
+        return self.ax.text(0, 0, "", ha="center", va="center", family="sans-serif", color=style.EDGE_LABEL_COLOR,
+                            clip_on=True, zorder=EDGE_LABEL_ZORDER, rotation_mode="anchor", transform_rotates_text=True,
+                            bbox=dict(facecolor="white", alpha=0.82, edgecolor="none", boxstyle="round,pad=0.4"))
+
+    def artist_count(self):
+        return len(self.edges) + len(self.labels) + len(self.edge_labels) + 1
+
+    def draw(self, graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod=LOD_FULL, visible=None):
+        import numpy as np
+
+        self.ax.set_xlim(*xlim); self.ax.set_ylim(*ylim)
+        draw_nodes, draw_edges = visible if visible is not None else (graph.nodes, graph.edges)
+        nodelist = [node for node in graph.nodes if node in draw_nodes and node in pos]
+        edgelist = [(u, v) for u, v in draw_edges if u in pos and v in pos]
+        label_fs, edge_label_fs, title_fs = style.zoom_font_sizes(zl)
+        sizes = {node: style.node_size_for(data) / (zl**0.55) for node, data in graph.nodes(data=True)}
+
+        with span("mpl.nodes"):
+            colors = [style.node_colors_for(graph.nodes[node]) for node in nodelist]
+            self.nodes.set_offsets(np.array([pos[node] for node in nodelist], dtype=float).reshape(-1, 2))
+            self.nodes.set_sizes([sizes[node] for node in nodelist])
+            self.nodes.set_facecolor([face for face, _ in colors])
+            self.nodes.set_edgecolor([edge for _, edge in colors])
+
+        with span("mpl.edges"):
+            for (u, v), patch in self.edges.update(edgelist):
+                color, width, line_style = style.edge_style(graph.nodes[u].get("type"), v, current_risk_score_normalized,
+                                                            graph.edges[u, v].get("weight"))
+                patch.set_positions(pos[u], pos[v])
+                patch.shrinkA, patch.shrinkB = math.sqrt(sizes[u]) / 2, math.sqrt(sizes[v]) / 2   # Stop at the marker edge
+                patch.set_color(color); patch.set_linewidth(width); patch.set_linestyle(line_style)
+
+        with span("mpl.labels"):
+            for node, text in self.labels.update(nodelist):
+                data = graph.nodes[node]
+                text.set_text(style.node_label(node, data) if lod == LOD_FULL else style.node_label_parts(node, data)[0])
+                text.set_position(pos[node]); text.set_fontsize(label_fs)
+
+        labelled = [(u, v) for u, v in edgelist if lod == LOD_FULL and graph.edges[u, v].get("relation")]
+        with span("mpl.edge_labels"):
+            for (u, v), text in self.edge_labels.update(labelled):
+                (x1, y1), (x2, y2) = pos[u], pos[v]
+                dx, dy = (x2 - x1, y2 - y1) if x2 >= x1 else (x1 - x2, y1 - y2)   # Keep the text upright
+                text.set_text(graph.edges[u, v]["relation"]); text.set_fontsize(edge_label_fs)
+                text.set_position(((x1 + x2) / 2, (y1 + y2) / 2)); text.set_rotation(math.degrees(math.atan2(dy, dx)))
+
+        self.title.set_fontsize(title_fs)
+        return self.fig, self.ax
+
+
+class FigurePool:
+    """Idle FigureContexts shared by every session; a render checks one out so no two threads draw on it at once."""
+    def __init__(self, max_idle=FIGURE_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+
+    @contextlib.contextmanager
+    def context(self):
+        with self._lock:
+            context = self._idle.pop() if self._idle else None
+            if context is None:
+                self.created += 1
+        if context is None:
+            context = FigureContext()
+        try:
+            yield context
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(context)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+            self.created = 0
+
+
+FIGURE_POOL = FigurePool()
+
+
+class MatplotlibRenderer(PathwayRenderer):
+    """The networkx-style matplotlib figure, drawn on pooled figures; imports matplotlib on first use."""
+    name = "matplotlib"
+
+    def __init__(self, pool=FIGURE_POOL):
+        self.pool = pool
+
+    def render_full(self, graph, pos, xlim, ylim, current_risk_score_normalized, lod=LOD_FULL):
+        import matplotlib
+        buf = io.StringIO()
+        with self.pool.context() as context:
+            fig, ax = context.draw(graph, pos, xlim, ylim, 1.0, current_risk_score_normalized, lod)
+            with matplotlib.rc_context({"svg.fonttype": "none"}):   # Keep text as text: smaller payload, browser emoji fonts
+                with span("mpl.savefig"):
+                    fig.savefig(buf, format="svg", facecolor=fig.get_facecolor())
+            fig_w_pt, fig_h_pt = fig.get_size_inches() * 72.0
+            box = ax.get_position()
+        transform = _transform(xlim, ylim, box.x0 * fig_w_pt, box.y0 * fig_h_pt, box.width * fig_w_pt, box.height * fig_h_pt, fig_h_pt)
+        return buf.getvalue(), transform
+
+    def render_viewport(self, graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod=LOD_FULL, visible=None):
+        buf = io.BytesIO()
+        with self.pool.context() as context:
+            fig, _ = context.draw(graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod, visible)
+            with span("mpl.savefig"):
+                fig.savefig(buf, format="png", facecolor=fig.get_facecolor())
+        return buf.getvalue()
+
+
+RENDERERS = {renderer.name: renderer for renderer in (SvgRenderer(), MatplotlibRenderer())}
+DEFAULT_RENDERER = SvgRenderer.name
+
+
+def get_renderer(name=DEFAULT_RENDERER):
+    return RENDERERS[name]
+
+
+# --- Cached Pathway Image ---
+def render_pathway(graph, pos, xlim, ylim, full_xlim, full_ylim, zl, current_risk_score_normalized,
+                   renderer_name=DEFAULT_RENDERER, mode=VIEWPORT_MODE_AUTO, cache=RENDER_CACHE):
+    """Image data for ``st.image``: a cropped full render (viewbox) or a culled per-viewport render."""
+    renderer = get_renderer(renderer_name)
+    if mode == VIEWPORT_MODE_AUTO:
+        mode = VIEWPORT_MODE_VIEWBOX if graph.number_of_nodes() <= VIEWBOX_MAX_NODES else VIEWPORT_MODE_RASTER
+    signature = render_signature(graph, pos)
+    if mode == VIEWPORT_MODE_VIEWBOX:
+        # One full-extent vector render per graph state; pan/zoom only rewrites the SVG viewBox.
+        lod = level_of_detail(1.0, graph.number_of_nodes())
+        key = ("full", renderer.name, signature, current_risk_score_normalized, lod)
+        rendered = cache.get(key)
+        if rendered is None:
+            with span(f"render.{renderer.name}.full"):
+                rendered = renderer.render_full(graph, pos, full_xlim, full_ylim, current_risk_score_normalized, lod)
+            cache.put(key, rendered, len(rendered[0]))
+        return crop_svg_viewbox(rendered[0], rendered[1], xlim, ylim)
+
+    key = ("viewport", renderer.name, signature, current_risk_score_normalized, zl, xlim, ylim)
+    image = cache.get(key)
+    if image is None:
+        visible = cull_to_viewport(graph, pos, xlim, ylim)
+        lod = level_of_detail(zl, len(visible[0]))
+        with span(f"render.{renderer.name}.viewport"):
+            image = renderer.render_viewport(graph, pos, xlim, ylim, zl, current_risk_score_normalized, lod, visible)
+        cache.put(key, image, len(image))
+    return image
+
+
+# --- viewBox Crop ---
+def crop_svg_viewbox(svg_text, transform, xlim, ylim):
+    (x_min, x_max), (y_min, y_max) = transform["xlim"], transform["ylim"]
+    sx = transform["ax_w"] / ((x_max - x_min) or 1.0)
+    sy = transform["ax_h"] / ((y_max - y_min) or 1.0)
+    left = transform["ax_x0"] + (xlim[0] - x_min) * sx
+    width = (xlim[1] - xlim[0]) * sx
+    top = transform["fig_h"] - (transform["ax_y0"] + (ylim[1] - y_min) * sy)   # SVG y axis points down
+    height = (ylim[1] - ylim[0]) * sy
+    return _VIEWBOX_RE.sub(f'viewBox="{left:.2f} {top:.2f} {width:.2f} {height:.2f}"', svg_text, count=1)
@@ -0,0 +1,118 @@
+from pathway_constants import HIGH_RISK_NODE_ID, HIGH_RISK_LABEL_PREFIX, SYMPTOM_NODE_PREFIX
+from triage_protocol import ProtocolError
+
+# --- Node Styles ---
+# (face colour, edge colour) per node type
+COLOR_MAP = {
+    "symptom_present": ("#FFCDD2", "#EF9A9A"),
+    "symptom_absent": ("#C8E6C9", "#A5D6A7"),
+    HIGH_RISK_NODE_ID: ("#B71C1C", "#7F0000"),
+    "risk_category": ("#FFF9C4", "#FFF59D"),
+    "default": ("#F5F5F5", "#E0E0E0")
+}
+# Marker area in points^2, as used by draw_networkx_nodes
+STYLE_MAP_SIZES = {
+    "symptom_present":5000, "symptom_absent":4500,
+    HIGH_RISK_NODE_ID: 6500, "risk_category":5000,
+}
+DEFAULT_NODE_SIZE = 4000
+BASE_NODE_FONT, BASE_EDGE_FONT = 11.5, 9.5
+
+DETAIL_TAGS = [("SNOMED_ID","SNOMED:"), ("GPHR_ID","GPHR:"), ("WHO_REF","WHO:"), ("Source", "Source:")]
+
+# --- Edge Styles ---
+# Colormap for more intense red progression as confirmed high-risk indicators grow
+RISK_CMAP_STOPS = [
+    (0.0, "#A5D6A7"),  # Softer Green (0 confirmed)
+    (0.16, "#FFEE58"), # Yellow (approx 2/12)
+    (0.33, "#FFC107"), # Amber (approx 4/12)
+    (0.41, "#F44336"), # Red (approx 5/12 - threshold)
+    (0.5, "#D32F2F"),  # Darker Red (approx 6/12)
+    (1.0, "#B71C1C")   # Very Dark Red (12/12)
+]
+DEFAULT_EDGE_STYLE = ("#78909C", 1.8, "solid")
+ABSENT_EDGE_STYLE = ("#CFD8DC", 1.5, "dashed")
+WEIGHTED_EDGE_WIDTH = (1.2, 6.0)  # Width at weight 0 and 1, for aggregate graphs
+
+BACKGROUND_COLOR = "#F8FAFC"
+TITLE_COLOR = "#37474F"
+EDGE_LABEL_COLOR = "#263238"
+TITLE_TEXT = "Interactive Newborn Health Pathway"
+
+
+def check_protocol(protocol):
+    """Raise ProtocolError unless the protocol's high-risk node is the one these styles are keyed by."""
+    node_type = protocol.node_defs[protocol.high_risk_node_id]["type"]
+    if protocol.high_risk_node_id != HIGH_RISK_NODE_ID or node_type != HIGH_RISK_NODE_ID:
+        raise ProtocolError(f"high-risk node '{protocol.high_risk_node_id}' (type '{node_type}') would not be drawn as "
+                            f"high risk: pathway_constants.HIGH_RISK_NODE_ID is '{HIGH_RISK_NODE_ID}'")
+
+
+def _hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip("#")
+    return tuple(int(hex_color[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+
+
+_RISK_STOPS_RGB = [(pos, _hex_to_rgb(color)) for pos, color in RISK_CMAP_STOPS]
+
+
+def risk_color_hex(value):
+    """Linear interpolation over RISK_CMAP_STOPS, matching LinearSegmentedColormap.from_list."""
+    value = min(1.0, max(0.0, value))
+    for (p0, c0), (p1, c1) in zip(_RISK_STOPS_RGB, _RISK_STOPS_RGB[1:]):
+        if value <= p1:
+            t = (value - p0) / (p1 - p0) if p1 > p0 else 0.0
+            rgb = [a + (b - a) * t for a, b in zip(c0, c1)]
+            break
+    else:
+        rgb = _RISK_STOPS_RGB[-1][1]
+    return "#" + "".join(f"{round(channel * 255):02X}" for channel in rgb)
+
+
+def node_style_key(data):
+    typ = data.get("type", "default")
+    return HIGH_RISK_NODE_ID if typ == HIGH_RISK_NODE_ID else typ
+
+
+def node_colors_for(data):
+    return COLOR_MAP.get(node_style_key(data), COLOR_MAP["default"])
+
+
+def node_size_for(data):
+    return STYLE_MAP_SIZES.get(node_style_key(data), DEFAULT_NODE_SIZE)
+
+
+def node_label_parts(node, data):
+    """(main label line, detail lines) for a pathway node."""
+    label_text = data.get("label", node)
+    typ = data.get("type", "default")
+    if typ == HIGH_RISK_NODE_ID: main_label_part = f"{HIGH_RISK_LABEL_PREFIX}{label_text}"
+    elif typ in ["symptom_present", "symptom_absent"]: main_label_part = f"{SYMPTOM_NODE_PREFIX}{label_text}"
+    else: main_label_part = label_text
+    details_parts = [f"{display_prefix} {data[tag]}" for tag, display_prefix in DETAIL_TAGS if data.get(tag)]
+    return main_label_part, details_parts
+
+
+def node_label(node, data):
+    main_label_part, details_parts = node_label_parts(node, data)
+    return main_label_part + ("\n\n" + "\n".join(details_parts) if details_parts else "")
+
+
+def edge_style(source_type, target, current_risk_score_normalized, weight=None):
+    """(colour, width, line style) for an edge, driven by the normalized risk score.
+
+    An edge with a ``weight`` in [0, 1] (aggregate graphs) is coloured and sized by that instead.
+    """
+    if weight is not None:
+        low, high = WEIGHTED_EDGE_WIDTH
+        return risk_color_hex(weight), low + (high - low) * min(1.0, max(0.0, weight)), 'solid'
+    if target == HIGH_RISK_NODE_ID and source_type == 'symptom_present':
+        return risk_color_hex(current_risk_score_normalized), 2.8 + (2.8 * current_risk_score_normalized), 'solid'
+    if target == HIGH_RISK_NODE_ID and source_type == 'symptom_absent':
+        return ABSENT_EDGE_STYLE
+    return DEFAULT_EDGE_STYLE
+
+
+def zoom_font_sizes(zl):
+    """(node label, edge label, title) font sizes for a zoom level."""
+    return max(4, BASE_NODE_FONT/(zl**0.45)), max(4, BASE_EDGE_FONT/(zl**0.45)), max(14, 22/(zl**0.5))
@@ -0,0 +1,140 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# --- Switch ---
+# Off by default; set TRIAGE_PERF_SPANS=1 (or assign ENABLED) to time the hot-path phases.
+ENABLED = os.environ.get("TRIAGE_PERF_SPANS", "") not in ("", "0")
+
+# --- Histogram Buckets ---
+# Upper bounds in milliseconds; anything slower lands in a final +Inf bucket.
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PROMETHEUS_METRIC = "triage_phase_duration_seconds"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram for one phase."""
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (capped at the slowest observation)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, bucket_count in zip(BUCKETS_MS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {"count": self.count, "total_ms": round(self.total_ms, 3), "max_ms": round(self.max_ms, 3),
+                "p50_ms": round(self.quantile(0.5), 3), "p95_ms": round(self.quantile(0.95), 3),
+                "p99_ms": round(self.quantile(0.99), 3),
+                "buckets": dict(zip([*map(str, BUCKETS_MS), "+Inf"], self.counts))}
+
+
+class SpanRecorder:
+    """Histograms per phase name; one for the whole process and one per session."""
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, ms):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(ms)
+
+    def snapshot(self):
+        """{phase: histogram dict}, sorted by phase name."""
+        with self._lock:
+            return {name: self._histograms[name].as_dict() for name in sorted(self._histograms)}
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+PROCESS_SPANS = SpanRecorder()
+_SESSION_SPANS = contextvars.ContextVar("session_spans", default=None)
+
+
+def bind_session(recorder):
+    """Also record spans from this thread/context into ``recorder`` (a session's own histograms)."""
+    _SESSION_SPANS.set(recorder)
+
+
+# --- Spans ---
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = (time.perf_counter() - self.start) * 1000.0
+        PROCESS_SPANS.observe(self.name, ms)
+        session = _SESSION_SPANS.get()
+        if session is not None:
+            session.observe(self.name, ms)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """``with span("phase"):`` times the block; a shared no-op when instrumentation is off."""
+    return _Span(name) if ENABLED else _NULL_SPAN
+
+
+# --- Export ---
+def to_json(recorder=PROCESS_SPANS):
+    return json.dumps({"unit": "ms", "phases": recorder.snapshot()}, indent=2)
+
+
+def to_prometheus(recorder=PROCESS_SPANS, metric=PROMETHEUS_METRIC):
+    """Prometheus text exposition format: one cumulative histogram per phase, in seconds."""
+    lines = [f"# HELP {metric} Duration of triage app hot-path phases.", f"# TYPE {metric} histogram"]
+    for name, hist in recorder.snapshot().items():
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        cumulative = 0
+        for bound, bucket_count in hist["buckets"].items():
+            cumulative += bucket_count
+            le = "+Inf" if bound == "+Inf" else repr(float(bound) / 1000.0)
+            lines.append(f'{metric}_bucket{{phase="{label}",le="{le}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{phase="{label}"}} {hist["total_ms"] / 1000.0!r}')
+        lines.append(f'{metric}_count{{phase="{label}"}} {hist["count"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,508 @@
+import threading
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+
+import answer_classifier
+from perf_spans import span
+
+# Answer every protocol symptom a message mentions, not only the question being asked
+MULTI_SYMPTOM_EXTRACTION = True
+# Skip questions whose answer can no longer change the outcome, and stop once none are left
+EARLY_DECISION = True
+# "protocol" asks questions in file order; "decisive" asks those that can change the most outcomes first
+QUESTION_ORDER_PROTOCOL, QUESTION_ORDER_DECISIVE = "protocol", "decisive"
+QUESTION_ORDER = QUESTION_ORDER_DECISIVE
+
+GREETING = "Hello! I'm here to help assess potential health risks for a newborn. Let's go through some questions. "
+COMPLETION_MESSAGE = (
+    "✅ We've completed the initial set of questions. The visual pathway shows the connections. "
+    "This is a preliminary guide. Always consult a healthcare provider for medical advice."
+)
+CLARIFY_MESSAGE = "I'm not sure whether that was a yes or a no for this one, so let me ask again."
+SKIP_MESSAGE = "These can no longer change the outcome, so I'll skip them: "
+
+# --- Transcript ---
+# The chat is kept as (MSG_*, argument) byte pairs and rendered by chat_messages. The argument is a
+# question's position in the protocol (the confirmed count for MSG_ALERT); a MSG_USER entry takes the
+# next submitted text. Everything else in a message follows from the protocol.
+(MSG_USER, MSG_GREETING, MSG_BEFORE_QUESTION, MSG_QUESTION, MSG_NOTED_YES, MSG_NOTED_NO, MSG_EARLIER_YES,
+ MSG_EARLIER_NO, MSG_SKIPPED, MSG_CLARIFY, MSG_ALERT, MSG_COMPLETION) = range(12)
+
+
+# --- Consultation State ---
+@dataclass
+class ConsultationState:
+    """Headless consultation state: the working form of an AnswerRecord while a message is applied.
+
+    ``messages`` holds transcript byte pairs and ``submissions`` the texts they refer to; the pathway
+    graph is built from the answers by pathway_graph.
+    """
+    messages: bytearray = field(default_factory=bytearray)
+    submissions: list = field(default_factory=list)
+    question_index: int = 0
+    current_question_id: str = None
+    current_question_id_for_next_prompt: str = None
+    confirmed_high_risk_indicators: int = 0
+    consultation_halted_due_to_risk: bool = False
+    answers: dict = field(default_factory=dict)          # question id -> symptom present
+    pending_answers: dict = field(default_factory=dict)  # Mentioned ahead of their question; applied when reached
+    skipped: set = field(default_factory=set)            # Question ids passed over by the decision engine
+
+
+def _post(protocol, state, code, question_id=None, arg=0):
+    state.messages += bytes((code, protocol.question_index[question_id] if question_id else arg))
+
+
+def classify_answer(user_answer_text):
+    """True when the answer reports the symptom as present; "unknown" counts as not present."""
+    return answer_classifier.classify(user_answer_text).label == answer_classifier.YES
+
+
+# --- Single Consultation ---
+def record_answer(protocol, state, question_id_answered, symptom_present_now):
+    """Apply one answer to the risk count; returns the thinking text ("" if unknown id)."""
+    q_data = protocol.question(question_id_answered)
+    if not q_data: return ""
+    symptom_present_previously = state.answers.get(question_id_answered) is True
+
+    if question_id_answered in protocol.high_risk_question_ids:
+        if symptom_present_now and not symptom_present_previously:
+            state.confirmed_high_risk_indicators += 1
+        elif not symptom_present_now and symptom_present_previously:
+            state.confirmed_high_risk_indicators = max(0, state.confirmed_high_risk_indicators - 1)
+
+    state.answers[question_id_answered] = symptom_present_now
+    state.skipped.discard(question_id_answered)
+
+    if state.confirmed_high_risk_indicators >= protocol.high_risk_trigger_threshold:
+        state.consultation_halted_due_to_risk = True
+
+    return _thinking_after(q_data, symptom_present_now)
+
+
+def _thinking_after(q_data, symptom_present_now):
+    prompts = q_data.get("thinking_prompts", {})
+    return prompts.get("after_yes", "Noted.") if symptom_present_now else prompts.get("after_no", "Okay, understood.")
+
+
+def _add_to_graph(protocol, graph, q_data, symptom_present_now):
+    s_node_id = q_data["symptom_node"]["id"]
+    s_type = "symptom_present" if symptom_present_now else "symptom_absent"
+    graph.add_node(s_node_id, label=q_data["symptom_node"]["label"], type=s_type,
+                   SNOMED_ID=q_data["symptom_node"].get("SNOMED_ID"), Source=q_data["symptom_node"].get("Source"))
+    for linked_node_id in q_data["links_to"]:
+        if linked_node_id not in protocol.node_defs: continue
+        props = protocol.node_defs[linked_node_id]
+        if not graph.has_node(linked_node_id): graph.add_node(linked_node_id, **props)
+
+        relation_label = "Related To"
+        if props["type"] == protocol.high_risk_node_id:
+            relation_label = "YES" if symptom_present_now else "No Clear Contribution"
+        elif props["type"] == "risk_category":
+            relation_label = "Is a Sign Of" if symptom_present_now else "Not Clearly a Sign"
+
+        graph.add_edge(s_node_id, linked_node_id, relation=relation_label)
+
+
+def process_answer(protocol, state, question_id_answered, user_answer_text):
+    return record_answer(protocol, state, question_id_answered, classify_answer(user_answer_text))
+
+
+# --- Early Decision ---
+Outlook = namedtuple("Outlook", ["halt_reachable", "flagged_categories", "open_categories"])
+
+
+def outlook(protocol, state):
+    """Which outcomes can still change.
+
+    The outcome of a consultation is whether it halts on high risk and which risk categories are
+    flagged (a category is flagged once any symptom linked to it is present). The halt is still
+    reachable while the confirmed count plus the unresolved high-risk questions meets the threshold;
+    a category stays open while it is unflagged and an unresolved question links to it.
+    """
+    unresolved = [q for q in protocol.questions if q["id"] not in state.answers]
+    remaining_high_risk = sum(q["id"] in protocol.high_risk_question_ids for q in unresolved)
+    halt_reachable = (not state.consultation_halted_due_to_risk and
+                      state.confirmed_high_risk_indicators + remaining_high_risk >= protocol.high_risk_trigger_threshold)
+
+    flagged = set()
+    for question_id, present in state.answers.items():
+        if present:
+            flagged.update(n for n in protocol.question(question_id)["links_to"] if n in protocol.node_defs and
+                           protocol.node_defs[n]["type"] == "risk_category")
+    open_categories = {n for q in unresolved for n in q["links_to"]
+                       if n in protocol.node_defs and protocol.node_defs[n]["type"] == "risk_category"} - flagged
+    return Outlook(halt_reachable, frozenset(flagged), frozenset(open_categories))
+
+
+def question_weight(protocol, q_data, current_outlook):
+    """How many still-open outcomes an answer to this question could change; 0 means it cannot matter."""
+    weight = int(current_outlook.halt_reachable and q_data["id"] in protocol.high_risk_question_ids)
+    return weight + sum(n in current_outlook.open_categories for n in q_data["links_to"])
+
+
+def _select_question(protocol, state):
+    # Unresolved questions: not answered, not currently posed, and not skipped unless since mentioned.
+    candidates = [q for q in protocol.questions if q["id"] not in state.answers and q["id"] != state.current_question_id and
+                  (q["id"] not in state.skipped or q["id"] in state.pending_answers)]
+    if not candidates:
+        return None, 0
+    current_outlook = outlook(protocol, state)
+    if QUESTION_ORDER == QUESTION_ORDER_DECISIVE:
+        # Answers already given cost nothing, so they go first; ties keep protocol order (sort is stable).
+        candidates.sort(key=lambda q: (q["id"] not in state.pending_answers, -question_weight(protocol, q, current_outlook)))
+    q_data = candidates[0]
+    return q_data, question_weight(protocol, q_data, current_outlook)
+
+
+def next_question(protocol, state, greeting=False):
+    """Advance to the next question; returns transcript entries (thinking before it or None, prompt).
+
+    Answers given ahead of their question are recorded as it comes up, and with EARLY_DECISION
+    questions that can no longer change the outcome are skipped.
+    """
+    skipped_now = []
+    while not state.consultation_halted_due_to_risk:
+        q_data, weight = _select_question(protocol, state)
+        if q_data is None:
+            break
+        if q_data["id"] in state.pending_answers:
+            present = state.pending_answers.pop(q_data["id"])
+            record_answer(protocol, state, q_data["id"], present)
+            _post(protocol, state, MSG_EARLIER_YES if present else MSG_EARLIER_NO, q_data["id"])
+            continue
+        if EARLY_DECISION and weight == 0:
+            state.skipped.add(q_data["id"])
+            skipped_now.append(q_data["id"])
+            continue
+        break
+    else:
+        q_data = None
+    for question_id in skipped_now:   # Consecutive MSG_SKIPPED entries make one message
+        _post(protocol, state, MSG_SKIPPED, question_id)
+    # Questions resolved or posed so far; reaches len(protocol.questions) once nothing is left to ask.
+    state.question_index = len(state.answers) + len(state.skipped) + (q_data is not None)
+
+    if state.consultation_halted_due_to_risk:
+        state.current_question_id_for_next_prompt = None
+        state.current_question_id = None
+        return None, (MSG_ALERT, None, state.confirmed_high_risk_indicators)
+
+    if q_data is not None:
+        state.current_question_id_for_next_prompt = q_data["id"]
+        return (MSG_GREETING if greeting else MSG_BEFORE_QUESTION, q_data["id"], 0), (MSG_QUESTION, q_data["id"], 0)
+
+    state.current_question_id_for_next_prompt = None
+    return None, (MSG_COMPLETION, None, 0)
+
+
+def _append_prompt(protocol, state, thinking, prompt):
+    # This sets current_question_id to the ID of the question that is about to be asked (or None if done/halted)
+    state.current_question_id = state.current_question_id_for_next_prompt
+    for entry in (thinking, prompt):
+        if entry is not None:
+            _post(protocol, state, *entry)
+
+
+def start_consultation(protocol, state):
+    """Post the greeting and first question."""
+    thinking, prompt = next_question(protocol, state, greeting=True)
+    _append_prompt(protocol, state, thinking, prompt)
+
+
+def submit_answer(protocol, state, user_answer_text):
+    """Record a user message, apply it to the current question and post what comes next.
+
+    With MULTI_SYMPTOM_EXTRACTION, other protocol symptoms the message mentions are answered too
+    and their questions are not asked. Returns True if the pathway graph was updated.
+    """
+    if state.consultation_halted_due_to_risk:
+        return False
+    state.submissions.append(user_answer_text)
+    _post(protocol, state, MSG_USER)
+
+    with span("engine.classify"):
+        tokens = answer_classifier.tokenize(user_answer_text)
+        mentions, consumed = {}, set()
+        if MULTI_SYMPTOM_EXTRACTION:
+            mentions = answer_classifier.matcher_for(protocol).extract_tokens(tokens, consumed)
+            tokens = [t for i, t in enumerate(tokens) if i not in consumed]   # "no" in "no chest indrawing" is not the answer
+        label = None
+        if state.current_question_id:
+            label = answer_classifier.classify_tokens(tokens).label
+            mentioned = mentions.pop(state.current_question_id, None)
+            # A mention only fills in for a reply with no yes/no of its own; if they disagree, or the
+            # reply only negates something else ("she's not sleeping well"), ask again.
+            if mentioned is not None and label in (answer_classifier.UNKNOWN, answer_classifier.UNCLEAR):
+                label = mentioned
+            elif (mentioned is not None and label != mentioned) or label == answer_classifier.UNCLEAR:
+                label = None
+    if state.current_question_id and label is None:
+        _ask_again(protocol, state, mentions)
+        return False
+    graph_updated = False
+    if state.current_question_id: # This refers to the question just answered
+        present = label == answer_classifier.YES
+        with span("engine.record_answer"):
+            record_answer(protocol, state, state.current_question_id, present)
+        _post(protocol, state, MSG_NOTED_YES if present else MSG_NOTED_NO, state.current_question_id)
+        graph_updated = True
+
+    _hold_mentions(state, mentions)
+
+    answered = len(state.answers)
+    state.current_question_id = None   # Answered above; next_question may now pick any unresolved question
+    with span("engine.next_question"):
+        thinking, prompt = next_question(protocol, state)
+        _append_prompt(protocol, state, thinking, prompt)
+    return graph_updated or len(state.answers) != answered
+
+
+def _hold_mentions(state, mentions):
+    for question_id, label in mentions.items():
+        if question_id not in state.answers:
+            state.pending_answers[question_id] = label == answer_classifier.YES
+
+
+def _ask_again(protocol, state, mentions):
+    # The current question stays posed; symptoms the message named for other questions are still kept.
+    _hold_mentions(state, mentions)
+    _post(protocol, state, MSG_CLARIFY)
+    _post(protocol, state, MSG_QUESTION, state.current_question_id)
+
+
+def chat_messages(protocol, transcript, submissions):
+    """The chat as {"role", "content", "type"} dicts, rendered from transcript byte pairs."""
+    messages, texts = [], iter(submissions)
+    questions = protocol.questions
+    for i in range(0, len(transcript), 2):
+        code, arg = transcript[i], transcript[i + 1]
+        if code == MSG_USER:
+            messages.append({"role": "user", "content": next(texts)})
+            continue
+        q_data = questions[arg] if arg < len(questions) else None
+        kind, content = "thinking", ""
+        if code in (MSG_GREETING, MSG_BEFORE_QUESTION):
+            content = (GREETING if code == MSG_GREETING else "") + q_data.get("thinking_prompts", {}).get("before_question", "")
+        elif code == MSG_QUESTION:
+            kind, content = "question", f"💬 {q_data['question_text']}"
+        elif code in (MSG_NOTED_YES, MSG_NOTED_NO):
+            content = _thinking_after(q_data, code == MSG_NOTED_YES)
+        elif code in (MSG_EARLIER_YES, MSG_EARLIER_NO):
+            present = code == MSG_EARLIER_YES
+            content = (f"From your earlier message, {q_data['symptom_node']['label']}: {'yes' if present else 'no'}. "
+                       f"{_thinking_after(q_data, present)}")
+        elif code == MSG_SKIPPED:
+            label = q_data["symptom_node"]["label"]
+            previous = messages[-1] if messages else None
+            if previous and previous.get("skipped"):
+                previous["content"] = previous["content"][:-1] + f", {label}."
+                continue
+            messages.append({"role": "assistant", "content": f"{SKIP_MESSAGE}{label}.", "type": "thinking", "skipped": True})
+            continue
+        elif code == MSG_CLARIFY:
+            content = CLARIFY_MESSAGE
+        elif code == MSG_ALERT:
+            kind = "alert"
+            content = (f"⚠️ **High Risk Alert!** Based on the responses, {arg} significant risk indicators have been "
+                       f"identified. **It is crucial to consult a healthcare professional immediately.** "
+                       f"No further automated questions will be asked.")
+        elif code == MSG_COMPLETION:
+            kind, content = "completion", COMPLETION_MESSAGE
+        if content:
+            messages.append({"role": "assistant", "content": content, "type": kind})
+    for message in messages:
+        message.pop("skipped", None)
+    return messages
+
+
+# --- Batch Scoring ---
+BatchScores = namedtuple("BatchScores", ["confirmed", "halted", "halt_question", "questions_asked", "risk_normalized"])
+
+
+def score_batch(protocol, answers, threshold=None):
+    """Score many consultations at once.
+
+    ``answers`` is a boolean matrix of shape (questions, cases) in protocol order; True means the
+    symptom was reported present. Questions are asked in protocol order and a case stops at the
+    first answer that brings its confirmed high-risk count to ``threshold``; later answers are
+    ignored, as in an interactive consultation with EARLY_DECISION off and QUESTION_ORDER
+    "protocol". Returns a BatchScores of per-case arrays;
+    ``halt_question`` is the 0-based question index that triggered the halt, or -1.
+    """
+    import numpy as np
+    answers = np.asarray(answers, dtype=bool)
+    if answers.ndim == 1:
+        answers = answers[:, None]
+    n_questions, n_cases = answers.shape
+    if n_questions != len(protocol.questions):
+        raise ValueError(f"expected {len(protocol.questions)} answer rows, got {n_questions}")
+    threshold = protocol.high_risk_trigger_threshold if threshold is None else threshold
+
+    high_risk_rows = np.fromiter((q["id"] in protocol.high_risk_question_ids for q in protocol.questions), dtype=bool, count=n_questions)
+    running = np.cumsum(answers & high_risk_rows[:, None], axis=0, dtype=np.int32)
+    reached = running >= threshold
+    halted = reached.any(axis=0)
+    halt_question = np.where(halted, reached.argmax(axis=0), -1)
+    last_asked = np.where(halted, halt_question, n_questions - 1)
+    confirmed = running[last_asked, np.arange(n_cases)] if n_questions else np.zeros(n_cases, dtype=np.int32)
+    risk_normalized = confirmed / protocol.max_high_risk_indicators if protocol.max_high_risk_indicators else np.zeros(n_cases)
+    return BatchScores(confirmed, halted, halt_question, last_asked + 1, risk_normalized)
+
+
+# --- Compact Session Record ---
+ANSWER_UNANSWERED, ANSWER_YES, ANSWER_NO, ANSWER_SKIPPED, ANSWER_PENDING_YES, ANSWER_PENDING_NO = range(6)
+GRAPH_CACHE_SIZE = 256   # Pathway graphs, shared by every session with the same answers
+
+
+class AnswerRecord:
+    """The per-session state: an ANSWER_* byte per question and the cursor, which are authoritative.
+
+    ``current_question`` is the position of the question awaiting an answer, or -1 when complete or
+    halted. The chat is ``transcript`` (byte pairs, see chat_messages) plus the submitted texts, the
+    only part that cannot be derived; the pathway graph comes from pathway_graph. The counters are
+    summaries of the answers, kept so analytics and the UI need not count.
+    """
+    __slots__ = ("answers", "current_question", "transcript", "submissions",
+                 "question_index", "confirmed_high_risk_indicators", "halted")
+
+    def __init__(self, n_questions):
+        self.answers = bytearray(n_questions)
+        self.current_question = -1
+        self.transcript = b""
+        self.submissions = ()
+        self.question_index = 0
+        self.confirmed_high_risk_indicators = 0
+        self.halted = False
+
+
+class ViewState:
+    """Pathway viewport for one session."""
+    __slots__ = ("zoom_level", "view_center_x", "view_center_y", "graph_extent_width", "graph_extent_height",
+                 "graph_content_center_x", "graph_content_center_y", "view_initialized_by_data")
+
+    def __init__(self):
+        self.zoom_level = 1.0
+        self.view_center_x = self.view_center_y = 0.0
+        self.graph_extent_width = self.graph_extent_height = 1.0
+        self.graph_content_center_x = self.graph_content_center_y = 0.0
+        self.view_initialized_by_data = False
+
+
+def answer_codes(protocol, state):
+    """The ANSWER_* byte per question for a ConsultationState."""
+    answers = bytearray(len(protocol.questions))
+    for question_id in state.skipped:
+        answers[protocol.question_index[question_id]] = ANSWER_SKIPPED
+    for question_id, present in state.pending_answers.items():
+        answers[protocol.question_index[question_id]] = ANSWER_PENDING_YES if present else ANSWER_PENDING_NO
+    for question_id, present in state.answers.items():
+        answers[protocol.question_index[question_id]] = ANSWER_YES if present else ANSWER_NO
+    return answers
+
+
+def _working_state(protocol, record):
+    state = ConsultationState(question_index=record.question_index,
+                              confirmed_high_risk_indicators=record.confirmed_high_risk_indicators,
+                              consultation_halted_due_to_risk=record.halted)
+    for q_data, code in zip(protocol.questions, record.answers):
+        if code in (ANSWER_YES, ANSWER_NO):
+            state.answers[q_data["id"]] = code == ANSWER_YES
+        elif code == ANSWER_SKIPPED:
+            state.skipped.add(q_data["id"])
+        elif code in (ANSWER_PENDING_YES, ANSWER_PENDING_NO):
+            state.pending_answers[q_data["id"]] = code == ANSWER_PENDING_YES
+    if record.current_question >= 0:
+        state.current_question_id = state.current_question_id_for_next_prompt = protocol.questions[record.current_question]["id"]
+    return state
+
+
+def _sync_record(protocol, record, state):
+    record.answers[:] = answer_codes(protocol, state)
+    record.current_question = protocol.question_index[state.current_question_id] if state.current_question_id else -1
+    record.transcript += state.messages
+    record.submissions += tuple(state.submissions)
+    record.question_index = state.question_index
+    record.confirmed_high_risk_indicators = state.confirmed_high_risk_indicators
+    record.halted = state.consultation_halted_due_to_risk
+
+
+def new_record(protocol):
+    record = AnswerRecord(len(protocol.questions))
+    state = ConsultationState()
+    start_consultation(protocol, state)
+    _sync_record(protocol, record, state)
+    return record
+
+
+def submit_to_record(protocol, record, user_answer_text):
+    """submit_answer for a compact record. Returns True if the pathway graph was updated."""
+    if record.halted or record.current_question < 0:
+        return False   # Complete: nothing is recorded until the session is reset
+    state = _working_state(protocol, record)
+    graph_updated = submit_answer(protocol, state, user_answer_text)
+    _sync_record(protocol, record, state)
+    return graph_updated
+
+
+def restore_record(protocol, submissions):
+    """Rebuild a session's record from its logged submissions, without rendering."""
+    record = new_record(protocol)
+    for text in submissions:
+        submit_to_record(protocol, record, text)
+    return record
+
+
+def record_messages(protocol, record):
+    return chat_messages(protocol, record.transcript, record.submissions)
+
+
+class GraphCache:
+    def __init__(self, maxsize=GRAPH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            graph = self._entries.get(key)
+            if graph is not None:
+                self._entries.move_to_end(key)
+            return graph
+
+    def put(self, key, graph):
+        with self._lock:
+            self._entries[key] = graph
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+GRAPH_CACHE = GraphCache()
+_RESOLVED = bytes(ANSWER_YES if code == ANSWER_YES else ANSWER_NO if code == ANSWER_NO else 0 for code in range(256))
+
+
+def pathway_graph(protocol, answers, cache=GRAPH_CACHE):
+    """The pathway DiGraph for ANSWER_* bytes, or None before the first answer.
+
+    Built in protocol order and shared by every session with the same answers, so callers must not
+    modify it.
+    """
+    key = bytes(answers).translate(_RESOLVED)
+    if not any(key):
+        return None
+    graph = cache.get((id(protocol), key))
+    if graph is None:
+        import networkx as nx
+        graph = nx.DiGraph()
+        for q_data, code in zip(protocol.questions, key):
+            if code:
+                _add_to_graph(protocol, graph, q_data, code == ANSWER_YES)
+        cache.put((id(protocol), key), graph)
+    return graph
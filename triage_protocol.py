@@ -0,0 +1,121 @@
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+
+# --- Protocol Files ---
+PROTOCOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "protocols")
+DEFAULT_PROTOCOL_PATH = os.path.join(PROTOCOL_DIR, "newborn_danger_signs.json")
+
+REQUIRED_QUESTION_KEYS = ("id", "question_text", "symptom_node", "links_to")
+REQUIRED_SYMPTOM_KEYS = ("id", "label")
+REQUIRED_NODE_DEF_KEYS = ("label", "type")
+
+
+class ProtocolError(ValueError):
+    """The protocol file is malformed or internally inconsistent."""
+
+
+def _freeze(value):
+    # Read-only views so one compiled protocol can be shared by every session without copies.
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True)
+class Protocol:
+    """A compiled question protocol. Questions and node definitions are read-only mappings."""
+    name: str
+    version: int
+    high_risk_node_id: str
+    high_risk_trigger_threshold: int
+    questions: tuple
+    node_defs: MappingProxyType
+    question_index: MappingProxyType          # question id -> position in ``questions``
+    high_risk_question_ids: frozenset         # questions whose symptom links to the high-risk node
+    max_high_risk_indicators: int
+
+    def question(self, question_id):
+        position = self.question_index.get(question_id)
+        return None if position is None else self.questions[position]
+
+    def __len__(self):
+        return len(self.questions)
+
+
+def compile_protocol(raw):
+    """Validate a decoded protocol document and build its indexes."""
+    if not isinstance(raw, dict):
+        raise ProtocolError("protocol must be a JSON object")
+    for key in ("high_risk_node_id", "node_defs", "questions"):
+        if key not in raw:
+            raise ProtocolError(f"protocol is missing '{key}'")
+    high_risk_node_id = raw["high_risk_node_id"]
+    node_defs = raw["node_defs"]
+    if not isinstance(raw["questions"], list):
+        raise ProtocolError("'questions' must be a list")
+    threshold = raw.get("high_risk_trigger_threshold", 5)
+    if not isinstance(threshold, int) or isinstance(threshold, bool) or threshold < 1:
+        raise ProtocolError(f"'high_risk_trigger_threshold' must be a positive integer, not {threshold!r}")
+    if high_risk_node_id not in node_defs:
+        raise ProtocolError(f"high-risk node '{high_risk_node_id}' has no entry in node_defs")
+    for node_id, props in node_defs.items():
+        missing = [k for k in REQUIRED_NODE_DEF_KEYS if k not in props]
+        if missing:
+            raise ProtocolError(f"node '{node_id}' is missing {missing}")
+
+    question_index, symptom_ids, high_risk_ids = {}, set(), set()
+    for position, q_data in enumerate(raw["questions"]):
+        missing = [k for k in REQUIRED_QUESTION_KEYS if k not in q_data]
+        if missing:
+            raise ProtocolError(f"question #{position + 1} is missing {missing}")
+        q_id = q_data["id"]
+        if q_id in question_index:
+            raise ProtocolError(f"duplicate question id '{q_id}'")
+        question_index[q_id] = position
+        missing = [k for k in REQUIRED_SYMPTOM_KEYS if k not in q_data["symptom_node"]]
+        if missing:
+            raise ProtocolError(f"symptom node of '{q_id}' is missing {missing}")
+        synonyms = q_data["symptom_node"].get("synonyms", [])
+        if not isinstance(synonyms, list) or not all(isinstance(x, str) and x.strip() for x in synonyms):
+            raise ProtocolError(f"synonyms of '{q_id}' must be a list of non-empty strings")
+        s_node_id = q_data["symptom_node"]["id"]
+        if s_node_id in symptom_ids or s_node_id in node_defs:
+            raise ProtocolError(f"symptom node id '{s_node_id}' of '{q_id}' is not unique")
+        symptom_ids.add(s_node_id)
+        unknown = [n for n in q_data["links_to"] if n not in node_defs]
+        if unknown:
+            raise ProtocolError(f"'{q_id}' links to undefined nodes {unknown}")
+        if high_risk_node_id in q_data["links_to"]:
+            high_risk_ids.add(q_id)
+
+    return Protocol(
+        name=raw.get("name", ""),
+        version=raw.get("version", 1),
+        high_risk_node_id=high_risk_node_id,
+        high_risk_trigger_threshold=threshold,
+        questions=_freeze(raw["questions"]),
+        node_defs=_freeze(node_defs),
+        question_index=MappingProxyType(question_index),
+        high_risk_question_ids=frozenset(high_risk_ids),
+        max_high_risk_indicators=len(high_risk_ids),
+    )
+
+
+def load_protocol(path=DEFAULT_PROTOCOL_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ProtocolError(f"{path}: {e}") from e
+    return compile_protocol(raw)
+
+
+@lru_cache(maxsize=None)
+def get_protocol(path=DEFAULT_PROTOCOL_PATH):
+    """Process-wide compiled protocol, loaded once per path."""
+    return load_protocol(path)